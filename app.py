@@ -1,22 +1,34 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, Response, stream_with_context, g
 from flask_sqlalchemy import SQLAlchemy
-import openai
+import llm
+import metrics
+import serialization
 import os
 from dotenv import load_dotenv
-from sqlalchemy import text
-from rapidfuzz import fuzz, process
+from sqlalchemy import text, bindparam, table, column, select, func, exists, tuple_, and_, asc, desc
+import click
 import json
 import logging
+import logging_setup
+import base64
+import time
+from datetime import datetime, date, timedelta
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from product_index import ProductIndex
+from sales_cache import CartItemNameCache
+from sales_aggregates import SalesAggregateStore
+import faq
+import intent_rules
+import sessions
 
 # Set up logging
-logging.basicConfig(level=logging.DEBUG)
+logging_setup.configure()
 
 app = Flask(__name__)
 
-openai.api_key = os.getenv("OPENAI_API_KEY", "")
-
 load_dotenv()
-app.config['SQLALCHEMY_DATABASE_URI'] = (
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL') or (
     f"mysql+pymysql://{os.getenv('CPANEL_DB_USER')}:{os.getenv('CPANEL_DB_PASSWORD')}"
     f"@{os.getenv('CPANEL_DB_HOST')}/{os.getenv('CPANEL_DB_NAME')}"
 )
@@ -25,6 +37,25 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db = SQLAlchemy(app)
 
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    logging_setup.sample_request()
+
+
+@app.after_request
+def record_request_metrics(response):
+    # For streamed responses this is the time to the first byte, and the
+    # Server-Timing header only covers the stages that ran before it.
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    metrics.observe("http_request_duration_seconds", time.perf_counter() - g.request_started, route=route)
+    metrics.inc("http_requests_total", route=route, status=response.status_code)
+    timings = g.get('server_timing')
+    if timings:
+        response.headers['Server-Timing'] = metrics.server_timing_header(timings)
+    return response
+
+
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     product_name = db.Column(db.String(255), nullable=False)
@@ -48,14 +79,195 @@ class Product(db.Model):
         return 'https://via.placeholder.com/150'
 
 
-def detect_user_intent(user_message):
-    try:
-        gpt_intent_response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": """
+# The photo URLs of indexed products are resolved once, when the catalog is indexed.
+def product_row_to_dict(product):
+    return {
+        'id': product.id,
+        'product_name': product.product_name,
+        'photo1': product.photo1,
+        'photo2': product.photo2,
+        'photo3': product.photo3
+    }
+
+
+def product_search_row_to_dict(product):
+    return {
+        'id': product.id,
+        'product_name': product.product_name,
+        'photo1': product.photo1,
+        'photo2': product.photo2,
+        'photo3': product.photo3,
+        'sub_category': product.sub_category,
+        'category': product.category,
+        'brand_name': product.brand
+    }
+
+
+def load_product_rows():
+    query = """
+        SELECT
+            p.id,
+            p.product_name,
+            p.photo1,
+            p.photo2,
+            p.photo3,
+            sc.sub_category,
+            c.category,
+            b.brand
+        FROM
+            product p
+        LEFT JOIN
+            sub_category sc ON p.sub_category = sc.id
+        LEFT JOIN
+            category c ON sc.category = c.id
+        LEFT JOIN
+            brand b ON p.brand = b.id
+    """
+    return db.session.execute(text(query)).fetchall()
+
+
+def product_catalog_signature():
+    return tuple(db.session.execute(text("SELECT COUNT(*), MAX(id) FROM product")).one())
+
+
+# Ranked token/trigram index over product, sub-category, category and brand names.
+# Built on first use, then rebuilt in the background when the catalog signature changes
+# and at least every PRODUCT_INDEX_MAX_AGE_SECONDS to pick up edited rows.
+product_index = ProductIndex(
+    load_product_rows,
+    product_catalog_signature,
+    check_interval=int(os.getenv('PRODUCT_INDEX_REFRESH_SECONDS', '60')),
+    max_age=int(os.getenv('PRODUCT_INDEX_MAX_AGE_SECONDS', '900')),
+    photo_url=Product.get_photo_url,
+    context=app.app_context
+)
+
+
+def load_cart_item_names(last_id):
+    query = """
+        SELECT id, LOWER(product_name)
+        FROM cart_item
+        WHERE id > :last_id
+        ORDER BY id
+    """
+    return db.session.execute(text(query), {'last_id': last_id}).fetchall()
+
+
+# Distinct cart_item product names for sales-order fuzzy matching, topped up from new rows only.
+cart_item_names = CartItemNameCache(load_cart_item_names)
+
+def load_sales_item_facts(last_id):
+    query = """
+        SELECT
+            cart_item.id,
+            salesman.username,
+            cart_item.product_name,
+            cart.buyer_area_name,
+            LOWER(cart.status),
+            cart.created,
+            cart_item.qty,
+            cart_item.total
+        FROM
+            cart_item
+        INNER JOIN
+            cart ON cart.id = cart_item.cart_id
+        INNER JOIN
+            salesman ON cart.buyer_id = salesman.id
+        WHERE
+            cart_item.id > :last_id
+        ORDER BY
+            cart_item.id
+    """
+    rows = db.session.execute(text(query), {'last_id': last_id}).fetchall()
+    return [(row[0], row[1], row[2], row[3], row[4], as_datetime(row[5]).date().isoformat(), row[6], row[7])
+            for row in rows]
+
+
+def load_sales_order_facts(last_id):
+    query = """
+        SELECT
+            cart.id,
+            salesman.username,
+            cart.buyer_area_name,
+            LOWER(cart.status),
+            cart.created,
+            cart.final_total,
+            EXISTS (SELECT 1 FROM cart_item WHERE cart_item.cart_id = cart.id)
+        FROM
+            cart
+        INNER JOIN
+            salesman ON cart.buyer_id = salesman.id
+        WHERE
+            cart.id > :last_id
+        ORDER BY
+            cart.id
+    """
+    rows = db.session.execute(text(query), {'last_id': last_id}).fetchall()
+    return [(row[0], row[1], row[2], row[3], as_datetime(row[4]).date().isoformat(), row[5], bool(row[6]))
+            for row in rows]
+
+
+# Per-salesman totals answering "most sold product" style questions without scanning order history.
+sales_aggregates = SalesAggregateStore(
+    load_sales_item_facts,
+    load_sales_order_facts,
+    rebuild_interval=int(os.getenv('SALES_AGGREGATE_REBUILD_SECONDS', '300')),
+    context=app.app_context
+)
+
+# Rows fetched per round trip when sales orders are read incrementally from the cursor.
+SALES_ORDER_FETCH_SIZE = int(os.getenv('SALES_ORDER_FETCH_SIZE', '100'))
+# Largest page of sales orders a single query returns; further orders are reached by cursor.
+SALES_ORDER_MAX_LIMIT = int(os.getenv('SALES_ORDER_MAX_LIMIT', '100'))
+# Most products a top-products answer lists.
+SALES_AGGREGATE_MAX_LIMIT = int(os.getenv('SALES_AGGREGATE_MAX_LIMIT', '50'))
+
+
+def wants_stream():
+    """Whether the client asked for server-sent events instead of a single JSON body."""
+    if request.args.get('stream') in ('1', 'true'):
+        return True
+    body = request.get_json(silent=True)
+    if isinstance(body, dict) and body.get('stream'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def json_response(payload, status=200):
+    return Response(serialization.dumps(payload), status=status, mimetype='application/json')
+
+
+def sse_event(event, data):
+    return b"event: " + event.encode() + b"\ndata: " + serialization.dumps(data) + b"\n\n"
+
+
+def stream_response(response_message, rows=(), row_event=None, done=None):
+    """Send the response message first, then one event per row as it is produced, then `done`."""
+    def generate():
+        yield sse_event("response", {"response": response_message})
+        count = 0
+        try:
+            for row in rows:
+                yield sse_event(row_event, row)
+                count += 1
+        except Exception as e:
+            logging.error("Error while streaming %s rows: %s", row_event, e)
+            yield sse_event("error", {"error": str(e)})
+            return
+        yield sse_event("done", dict(done or {}, count=count))
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# Greetings, FAQ questions and obvious search/order phrasings are answered without the model.
+LOCAL_INTENT_RULES = os.getenv('LOCAL_INTENT_RULES', '1') == '1'
+
+# "combined" asks for the intent and the search/sales-order entities in one model call;
+# "multi" keeps the separate intent and extraction calls.
+CHAT_PIPELINE = os.getenv('CHAT_PIPELINE', 'combined')
+
+INTENT_SYSTEM_PROMPT = """
                         You are an assistant for Hardware Store, You name is F.Y.H Smart Agent that detects the user's intent and responds accordingly. Possible intents include:
                         - general: for greetings, or If questions regarding general are asked reply using QUESTIONS and answers.  QUESTIONS and answers are only for general
                         - sales_order: when the user is asking about an order or sales order inquiry like "Search for sales order", "Search for order", "which is the most sold product". 
@@ -64,44 +276,52 @@ def detect_user_intent(user_message):
                         Respond with: {"intent": "<intent>", "response": "<response>", "category": "<category_name_if_any>"}
                         
                         QUESTIONS, Answers = {
-                        ("What products does Sales Navigator Online Store offer? Sales Navigator Online Store specializes in products like mechanical scales, digital scales, hardware tools, power tools, food processing machinery, agriculture tools and equipment, industrial tools and machinery, construction tools and materials, and automotive products."),
-                        ("How long has Sales Navigator Online Store been in business? Sales Navigator Online Store, run by Fong Yuan Hung Import and Export Sdn. Bhd., has been serving customers since 1980."),
-                        ("Where is Sales Navigator Online Store's market located? Our primary market is in East Malaysia, covering Sarawak and Sabah."),
-                        ("From which countries does Sales Navigator Online Store import products? We import products from countries like China, Taiwan, South Korea, Thailand, Vietnam, the Philippines, India, the UK, Australia, and New Zealand."),
-                        ("How can I contact Sales Navigator Online Store for more information? For support, email us at support@questmarketing.com.my. For business inquiries, use the contact details on our website."),
-                        ("What is the annual import volume of Sales Navigator Online Store? We import approximately 10-15 containers (20 feet each) of goods annually."),
-                        ("What product categories are available? We offer: Weighing Equipment, Agriculture Tools, Construction Materials, Industrial Machinery, General Hardware, Automotive Products."),
-                        ("Can customers create an account on the website? Account creation is restricted to admins and salesmen only. Customers can browse and place orders without creating an account."),
-                        ("What should I do if I forgot my password? Salesmen should contact the admin to reset their password at support@questmarketing.com.my."),
-                        ("How do I change my password? Salesmen need to email the admin at support@questmarketing.com.my to request a password change."),
-                        ("Who can access the admin features? Only authorized admins and salesmen can access admin features. Contact your admin for permissions.")
-                        ("How do I place an order? Add products to your cart on our website and proceed to checkout. For assistance, contact our sales team."),
-                        ("What are the payment methods available? We accept credit/debit cards, bank transfers, and online payment gateways."),
-                        ("How can I track my order status? You'll receive a tracking number via email after placing an order. Use it to track your order on our website."),
-                        ("What is your return and exchange policy? We offer returns and exchanges for defective or damaged products. Check our terms and conditions or contact support."),
-                        ("How can I contact customer service? Email us at support@questmarketing.com.my or use the contact form on our website."),
-                        ("Are there any shipping charges? Shipping charges depend on order size and destination. The cost is calculated during checkout."),
-                        ("Do you ship internationally? Our primary market is East Malaysia, but we may accommodate international shipping requests. Contact customer service for details."),
-                        ("Can I cancel or modify my order after placing it? You can modify or cancel orders within a limited timeframe. Contact customer service as soon as possible."),
-                        ("What warranties do you offer on your products? Most products come with a manufacturer's warranty. Check product details or contact support for warranty information."),
-                        ("How do I register an account on your website? Click on 'Sign In' and select 'Create an Account'. Follow the prompts to complete registration.")
-                        ("How do I log in to the admin or salesman portal? The login portal is for admins and salesmen only. Click on 'Sign In' on the homepage and enter your credentials."),
-                        ("Are there any promotions or discounts available? Yes, we offer regular promotions and discounts. Check the promotions page or contact our sales team."),
-                        ("How can I check the availability of a specific product? Search for the product on our website or contact customer service with the product name or ID."),
-                        ("Do you offer bulk purchase discounts? Yes, we provide bulk purchase discounts. Contact our sales team for details."),
-                        ("Can I get a product demo or sample before purchasing? We may offer demos or samples for certain products. Contact our sales team to inquire."),
-                        ("How do I become a distributor for Sales Navigator products? Fill out the distributor application on our website or contact our business development team.")
+"""
+
+INTENT_SYSTEM_PROMPT_END = """
                     ]
                 }
                     """
-                },
-                {"role": "user", "content": f"{user_message}"}
-            ],
-            max_tokens=100,
-            temperature=0.3,
-        )
-        intent_response = gpt_intent_response['choices'][0]['message']['content'].strip()
-        return json.loads(intent_response)
+
+# FAQ entries retrieved into the intent prompt for each message; 0 sends the whole table.
+FAQ_PROMPT_ENTRIES = int(os.getenv('FAQ_PROMPT_ENTRIES', '3'))
+
+
+def intent_system_prompt(user_message):
+    """The intent prompt with only the FAQ entries relevant to this message."""
+    if FAQ_PROMPT_ENTRIES <= 0:
+        entries = faq.FAQ
+    else:
+        # Messages that share no terms with any entry get the store overview entries instead.
+        entries = faq.retriever.retrieve(user_message, FAQ_PROMPT_ENTRIES) or faq.FAQ[:FAQ_PROMPT_ENTRIES]
+    return INTENT_SYSTEM_PROMPT + faq.render_faq(entries, indent=" " * 24) + INTENT_SYSTEM_PROMPT_END
+
+
+def intent_completion(user_message):
+    return llm.Completion(
+        intent_system_prompt(user_message),
+        f"{user_message}",
+        max_tokens=100,
+        temperature=0.3,
+        cache_key=user_message,
+        parse=json.loads,
+        name="intent"
+    )
+
+
+def local_intent(user_message):
+    if LOCAL_INTENT_RULES:
+        return intent_rules.classify(user_message)
+    return None
+
+
+def detect_user_intent(user_message):
+    intent_data = local_intent(user_message)
+    if intent_data is not None:
+        return intent_data
+
+    try:
+        return llm.complete(intent_completion(user_message))
     except Exception as e:
         return {"intent": "general", "response": "Hello! How may I assist you today?"}
 
@@ -111,115 +331,102 @@ def handle_chat():
     try:
         user_message = request.json.get('message')
         selected_category = request.json.get('category')
-        intent_data = detect_user_intent(user_message)
-        intent = intent_data.get("intent")
-        category = intent_data.get("category", None)
         loggedInUsername = request.json.get('username')
-        
-        if intent == "general":
-            return jsonify({"response": intent_data.get("response")})
-        elif intent == "sales_order":
-            if selected_category == "sales_order":
-                return sales_order_inquiry(loggedInUsername)
-            else:
-                return jsonify({"response": "It looks like you're asking about a sales order. Please switch to the 'Sales Order' category to proceed."})
-        elif intent == "product_search":
-            if selected_category == "search_product":
-                search_term = user_message
-                return search_products(search_term=search_term)
+
+        # "next 10" or "only the pending ones" after a sales-order query reuse its entities and cursor
+        if selected_category == "sales_order":
+            follow_up = chat_sessions.follow_up(loggedInUsername, user_message)
+            if follow_up is not None:
+                return sales_follow_up(loggedInUsername, follow_up)
+
+        with metrics.timed("intent"):
+            if CHAT_PIPELINE == "combined":
+                intent_data = detect_intent_with_entities(user_message)
             else:
-                return jsonify({"response": "It seems you're looking for a product. Please switch to the 'Product Search' category to proceed."})
+                intent_data = detect_user_intent(user_message)
+
+        reply = chat_reply(intent_data, selected_category)
+        if reply is not None:
+            if wants_stream():
+                return stream_response(reply["response"])
+            return json_response(reply)
+        elif intent_data.get("intent") == "sales_order":
+            return sales_order_inquiry(loggedInUsername, entities=intent_data.get("entities"))
         else:
-            return jsonify({"response": "Sorry, I didn't understand that. Can you clarify?"})
+            search_term = user_message
+            return search_products(search_term=search_term, search_attributes=intent_data.get("search"))
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}, 500)
+
+
+def chat_reply(intent_data, selected_category):
+    """The direct reply for a chat intent, or None when it goes on to the search or sales-order stage."""
+    intent = intent_data.get("intent")
+    if intent == "general":
+        return {"response": intent_data.get("response")}
+    elif intent == "sales_order":
+        if selected_category == "sales_order":
+            return None
+        return {"response": "It looks like you're asking about a sales order. Please switch to the 'Sales Order' category to proceed."}
+    elif intent == "product_search":
+        if selected_category == "search_product":
+            return None
+        return {"response": "It seems you're looking for a product. Please switch to the 'Product Search' category to proceed."}
+    else:
+        return {"response": "Sorry, I didn't understand that. Can you clarify?"}
+
+
+PREPROCESS_SYSTEM_PROMPT = """
+                Extract product name, color, and attributes from queries.
+                Return in format: {"product": "<name>", "color": "<color>", "other_attributes": "<attributes>"}
+                """
+
+
+def preprocess_completion(text):
+    return llm.Completion(
+        PREPROCESS_SYSTEM_PROMPT,
+        f"Preprocess this text: {text}.",
+        max_tokens=50,
+        temperature=0.3,
+        cache_key=text,
+        parse=llm.json_content,
+        name="preprocess"
+    )
 
 
 def preprocess_with_gpt(text):
     try:
-        gpt_response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": """
-                Extract product name, color, and attributes from queries.
-                Return in format: {"product": "<name>", "color": "<color>", "other_attributes": "<attributes>"}
-                """},
-                {"role": "user", "content": f"Preprocess this text: {text}."}
-            ],
-            max_tokens=50,
-            temperature=0.3,
-        )
-        cleaned_text = gpt_response['choices'][0]['message']['content'].strip()
+        cleaned_text = llm.complete(preprocess_completion(text))
         return cleaned_text
     except Exception as e:
         return text
 
 
-def handle_search_with_products(product_name="", category_name=None, sub_category_name=None):
-    search_keywords = preprocess_with_gpt(product_name)
-    if not search_keywords:
-        return "Error: Unable to process search query.", []
+def handle_search_with_products(product_name="", category_name=None, sub_category_name=None, search_attributes=None):
+    if search_attributes is None:
+        with metrics.timed("preprocess"):
+            search_keywords = preprocess_with_gpt(product_name)
+        if not search_keywords:
+            return "Error: Unable to process search query.", []
 
     try:
-        extracted_data = json.loads(search_keywords)
+        if search_attributes is None:
+            extracted_data = json.loads(search_keywords)
+        else:
+            extracted_data = search_attributes
         product_name = extracted_data['product']
         color = extracted_data.get('color')
-        search_pattern = f"%{product_name}%"
-
-        query = """
-            SELECT
-                p.id AS product_id,
-                p.product_name,
-                p.photo1,
-                p.photo2,
-                p.photo3,
-                sc.sub_category AS sub_category_name,
-                c.category AS category_name,
-                b.brand AS brand_name
-            FROM
-                product p
-            JOIN
-                sub_category sc ON p.sub_category = sc.id
-            JOIN
-                category c ON sc.category = c.id
-            JOIN
-                brand b ON p.brand = b.id
-            WHERE
-                (LOWER(p.product_name) LIKE :search_pattern
-                OR LOWER(c.category) LIKE :search_pattern
-                OR LOWER(sc.sub_category) LIKE :search_pattern)
-        """
-
-        params = {'search_pattern': search_pattern}
-        if color:
-            query += " AND UPPER(p.product_name) LIKE :color"
-            params['color'] = f"%{color}%"
-
-        query += " ORDER BY p.product_name LIMIT 50;"
-        result_set = db.session.execute(text(query), params).fetchall()
-
-        matched_products = []
-        for row in result_set:
-            matched_products.append({
-                'id': row[0],
-                'product_name': row[1],
-                'photo1': Product.get_photo_url(row[2]),
-                'photo2': Product.get_photo_url(row[3]),
-                'photo3': Product.get_photo_url(row[4]),
-                'sub_category': row[5],
-                'category': row[6],
-                'brand_name': row[7]
-            })
+
+        with metrics.timed("search_index"):
+            matched_products = [product_search_row_to_dict(row) for row in product_index.search(product_name, color=color)]
 
     except Exception as e:
         return f"Error: {str(e)}", []
 
     if not matched_products:
-        all_products = Product.query.all()
-        product_dicts = [product.to_dict() for product in all_products]
-        matches = process.extract(product_name, [p['product_name'] for p in product_dicts], scorer=fuzz.partial_ratio)
-        best_matches = [product_dicts[i] for match, score, i in matches if score > 70]
+        with metrics.timed("fuzzy_fallback"):
+            best_matches = [product_row_to_dict(row) for row in product_index.fuzzy_search(product_name)]
         if best_matches:
             matched_products.extend(best_matches)
 
@@ -230,61 +437,26 @@ def handle_search_with_products(product_name="", category_name=None, sub_categor
 
 
 @app.route('/search', methods=['GET'])
-def search_products(search_term=None):
+def search_products(search_term=None, search_attributes=None):
     if not search_term:
         search_term = request.args.get('q', '')
 
     category_id = request.args.get('category_id')
     sub_category_id = request.args.get('sub_category_id')
 
-    response_message, matched_products = handle_search_with_products(search_term, category_id, sub_category_id)
+    response_message, matched_products = handle_search_with_products(search_term, category_id, sub_category_id, search_attributes)
 
-    return jsonify({
-        "response": response_message,
-        "products": matched_products if matched_products else []
-    })
+    if wants_stream():
+        return stream_response(response_message, matched_products, "product")
 
+    with metrics.timed("serialize"):
+        return json_response({
+            "response": response_message,
+            "products": matched_products if matched_products else []
+        })
 
-@app.route('/sales_order_inquiry', methods=['POST'])
-def sales_order_inquiry(loggedInUsername):
-    try:
-        logging.debug("sales_order_inquiry endpoint called.")
-        user_message = request.json.get('message')
-        if not user_message:
-            logging.error("No message received in request.")
-            return jsonify({"error": "Message is required"}), 400
 
-        # Log the received message
-        logging.debug(f"User message received: {user_message}")
-
-        # Use OpenAI to extract the relevant entities
-        gpt_extraction_response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": """
-                    You are a SQL query generator. Your task is to take natural language queries from users and extract relevant entities in JSON format, and generate the appropriate SQL query to retrieve sales order information from a database.
-
-                    ### The database has the following structure:
-
-                    - `cart` table, which contains:
-                    - `id` (the sales order ID),
-                    - `created` (the date the order was created),
-                    - `status` (e.g., "pending", "void", "confirm"),
-                    - `customer_company_name` (the name of the customer’s company),
-                    - `final_total` (the final total of the sales order),
-                    - `order_option` (e.g., "Urgent", "Credit Term"),
-                    - `buyer_area_name` (e.g., "Kuching", "KCH").
-
-                    - `cart_item` table, which contains:
-                    - `cart_id` (the ID of the sales order),
-                    - `product_name` (the name of the product),
-                    - `qty` (quantity of the product in the order: e.g., 15 if the user asks for "show me sales order with 15 hammer"),
-                    - `unit_price` (unit price of the product),
-                    - `total` (total price for the product).
-
-                    ### Your task is to extract the following entities from the user’s query:
+SALES_ENTITY_SCHEMA = """                    ### Your task is to extract the following entities from the user’s query:
 
                     - **`status`**: The status of the sales order (e.g., "pending", "void", "confirm", "complete").
                     - **`limit`**: The number of distinct sales orders to return (e.g., 5 if the user asks for "5 sales orders").
@@ -300,6 +472,11 @@ def sales_order_inquiry(loggedInUsername):
                     - **`order_option`**: The order option (e.g., "Urgent", "Credit Term"), if specified.
                     - **`date`**: The date of the sales order, if specified.
                     - **`product_count`**: The number of different products in the order, if specified.
+                    - **`aggregate`**: Only for questions about totals rather than individual orders:
+                    - "top_products" for the most sold products (e.g., "which is the most sold product"),
+                    - "top_products_by_revenue" for the products that brought in the most money,
+                    - "revenue_by_area" for sales per buyer area,
+                    - "order_count" for how many orders there are (e.g., "how many pending orders do I have").
 
                     ### SQL Query Example:
                     - Extract relevant entities from user input and format it as:
@@ -319,187 +496,632 @@ def sales_order_inquiry(loggedInUsername):
                     }
                     If an entity is not present in the query, omit it from the JSON response.
                     """
-                },
-                {"role": "user", "content": f"Extract entities from this query: {user_message}."}
-            ],
-            max_tokens=150,
-            temperature=0.7,
-        )
 
-        logging.debug("Received response from OpenAI GPT model.")
+SALES_ENTITY_SYSTEM_PROMPT = """
+                    You are a SQL query generator. Your task is to take natural language queries from users and extract relevant entities in JSON format, and generate the appropriate SQL query to retrieve sales order information from a database.
+
+""" + SALES_ENTITY_SCHEMA
+
+COMBINED_INSTRUCTIONS = """
+                        In the same JSON object, also return what the next stage needs:
+                        - when the intent is product_search, add "search": {"product": "<name>", "color": "<color>", "other_attributes": "<attributes>"}
+                        - when the intent is sales_order, add "entities": {<sales order entities>}, extracted as described below.
+
+""" + SALES_ENTITY_SCHEMA
+
+
+def sales_entity_completion(user_message):
+    return llm.Completion(
+        SALES_ENTITY_SYSTEM_PROMPT,
+        f"Extract entities from this query: {user_message}.",
+        max_tokens=150,
+        temperature=0.7,
+        cache_key=user_message,
+        parse=json.loads,
+        name="sales_entities"
+    )
+
+
+def combined_completion(user_message):
+    return llm.Completion(
+        intent_system_prompt(user_message) + COMBINED_INSTRUCTIONS,
+        f"{user_message}",
+        max_tokens=250,
+        temperature=0.3,
+        cache_key=user_message,
+        parse=json.loads,
+        name="combined"
+    )
+
+
+def detect_intent_with_entities(user_message):
+    """One model call that returns the intent together with the search attributes or sales-order entities."""
+    intent_data = local_intent(user_message)
+    if intent_data is not None:
+        return intent_data
+
+    try:
+        intent_data = llm.complete(combined_completion(user_message))
+    except Exception as e:
+        return {"intent": "general", "response": "Hello! How may I assist you today?"}
+    return clean_combined_intent(intent_data)
+
+
+def clean_combined_intent(intent_data):
+    # Drop malformed stage payloads so the caller falls back to the dedicated extraction call.
+    search = intent_data.get("search")
+    if not isinstance(search, dict) or not search.get("product"):
+        intent_data.pop("search", None)
+    if not isinstance(intent_data.get("entities"), dict):
+        intent_data.pop("entities", None)
+    return intent_data
+
+
+# Bound on queries per batch request and on model calls a batch runs at once.
+BATCH_MAX_QUERIES = int(os.getenv('BATCH_MAX_QUERIES', '20'))
+batch_executor = ThreadPoolExecutor(max_workers=int(os.getenv('BATCH_LLM_WORKERS', '8')), thread_name_prefix='batch')
+
 
-        # Extract entities from OpenAI response
-        extracted_entities = gpt_extraction_response['choices'][0]['message']['content'].strip()
-        logging.debug(f"Extracted entities from GPT: {extracted_entities}")
+@app.route('/search/batch', methods=['POST'])
+def search_products_batch():
+    body = request.get_json(silent=True) or {}
+    queries = body.get('queries')
+    if not isinstance(queries, list) or not queries:
+        return json_response({"error": "queries must be a non-empty list"}, 400)
+    if not all(isinstance(query, str) for query in queries):
+        return json_response({"error": "Every query must be a string"}, 400)
+    if len(queries) > BATCH_MAX_QUERIES:
+        return json_response({"error": f"At most {BATCH_MAX_QUERIES} queries are allowed per batch"}, 400)
 
+    # Identical terms share one model call and one catalog search.
+    unique_terms = {}
+    for query in queries:
+        unique_terms.setdefault(llm.normalize_message(query), query)
+
+    search_keywords = dict(zip(unique_terms, batch_executor.map(preprocess_with_gpt, unique_terms.values())))
+
+    # The catalog search is in memory, so once the keywords are back the searches need no SQL.
+    results = {}
+    for key, term in unique_terms.items():
         try:
-            # Sanitize the response to ensure it starts and ends with curly braces
-            extracted_entities = gpt_extraction_response['choices'][0]['message']['content'].strip()
-            # Attempt to parse the JSON
-            entities = json.loads(extracted_entities)
-            logging.debug(f"Parsed entities into JSON: {entities}")
-        except json.JSONDecodeError as e:
-            logging.error(f"Failed to decode GPT response into JSON: {str(e)}")
-            return jsonify({"error": "Failed to extract entities from user query"}), 400
+            search_attributes = json.loads(search_keywords[key])
+        except ValueError as e:
+            results[key] = (f"Error: {str(e)}", [])
+            continue
+        results[key] = handle_search_with_products(term, search_attributes=search_attributes)
+
+    return json_response({"results": [
+        {
+            "query": query,
+            "response": results[llm.normalize_message(query)][0],
+            "products": results[llm.normalize_message(query)][1]
+        }
+        for query in queries
+    ]})
+
 
+@app.route('/sales_order_inquiry', methods=['POST'])
+def sales_order_inquiry(loggedInUsername, entities=None, cursor=None):
+    try:
+        logging.debug("sales_order_inquiry endpoint called.")
+        user_message = request.json.get('message')
+        if not user_message:
+            logging.error("No message received in request.")
+            return json_response({"error": "Message is required"}, 400)
+
+        # Log the received message
+        logging.debug("User message received: %s", logging_setup.summarize(user_message))
+
+        try:
+            # Use OpenAI to extract the relevant entities, parsed as JSON, unless the intent call already did
+            if entities is None:
+                with metrics.timed("sales_entities"):
+                    entities = llm.complete(sales_entity_completion(user_message))
+            logging.debug("Parsed entities into JSON: %s", entities)
+        except json.JSONDecodeError as e:
+            logging.error("Failed to decode GPT response into JSON: %s", e)
+            return json_response({"error": "Failed to extract entities from user query"}, 400)
+
+
+        if entities.get('aggregate') in SALES_AGGREGATES:
+            with metrics.timed("sales_aggregate"):
+                response_message, aggregates = process_sales_aggregate_query(entities, loggedInUsername)
+            chat_sessions.save(loggedInUsername, entities)
+            if wants_stream():
+                return stream_response(response_message, aggregates, "aggregate")
+            return json_response({"response": response_message, "sales_orders": [], "aggregates": aggregates})
+
+        # Continuation cursor from the previous page, if the client is paging. It is checked
+        # before the query runs, so a bad one neither runs it nor replaces the session.
+        if cursor is None:
+            cursor = request.json.get('cursor')
+        if cursor is not None:
+            try:
+                cursor = decode_sales_order_cursor(cursor)
+            except ValueError as e:
+                return json_response({"error": str(e)}, 400)
+
+        if wants_stream():
+            response_message, sales_orders, next_cursor = stream_sales_order_query(entities, loggedInUsername, cursor)
+            chat_sessions.save(loggedInUsername, entities, next_cursor)
+            return stream_response(response_message, sales_orders, "order", done={"next_cursor": next_cursor})
 
         # Process the extracted entities like product search
-        response_message, sales_orders = process_sales_order_query(entities, loggedInUsername)
+        response_message, sales_orders, next_cursor = process_sales_order_query(entities, loggedInUsername, cursor)
+        chat_sessions.save(loggedInUsername, entities, next_cursor)
 
-        logging.debug(f"Sales order query result: {sales_orders}")
+        logging.debug("Sales order query result: %s", logging_setup.summarize(sales_orders))
 
-        return jsonify({"response": response_message, "sales_orders": sales_orders})
+        with metrics.timed("serialize"):
+            return json_response({"response": response_message, "sales_orders": sales_orders, "next_cursor": next_cursor})
 
     except Exception as e:
-        logging.error(f"Error in sales_order_inquiry: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        logging.error("Error in sales_order_inquiry: %s", e)
+        return json_response({"error": str(e)}, 500)
     
 
-def process_sales_order_query(entities, loggedInUsername):
+SESSION_REDIS_URL = os.getenv('SESSION_REDIS_URL')
+SESSION_TTL = int(os.getenv('SESSION_TTL', '1800'))
+
+# Each user's last sales-order entities and next-page cursor. Kept per process unless
+# SESSION_REDIS_URL points at a Redis-compatible server shared by all workers.
+chat_sessions = sessions.SessionStore(
+    sessions.RedisSessionBackend(SESSION_REDIS_URL, ttl=SESSION_TTL) if SESSION_REDIS_URL else None,
+    maxsize=int(os.getenv('SESSION_CACHE_SIZE', '10000')),
+    ttl=SESSION_TTL
+)
+
+NO_MORE_SALES_ORDERS = "There are no more matching sales orders."
+
+
+def sales_follow_up(loggedInUsername, follow_up):
+    if follow_up.exhausted:
+        if wants_stream():
+            return stream_response(NO_MORE_SALES_ORDERS, done={"next_cursor": None})
+        return json_response({"response": NO_MORE_SALES_ORDERS, "sales_orders": [], "next_cursor": None})
+    return sales_order_inquiry(loggedInUsername, entities=follow_up.entities, cursor=follow_up.cursor)
+
+
+# Lightweight Core tables: enough to generate the sales-order SQL. Values go to and come
+# from the driver untouched, as they did with the textual queries.
+cart_table = table(
+    'cart',
+    column('id'), column('created'), column('status'), column('customer_company_name'),
+    column('final_total'), column('order_option'), column('buyer_area_name'), column('buyer_id')
+)
+cart_item_table = table(
+    'cart_item',
+    column('id'), column('cart_id'), column('product_name'), column('qty'), column('unit_price'), column('total')
+)
+salesman_table = table('salesman', column('id'), column('username'))
+
+SORT_DIRECTIONS = {'asc': asc, 'desc': desc}
+
+# The condition each sales-order entity filter adds to the page query.
+SALES_ORDER_FILTER_CONDITIONS = {
+    'status': lambda: func.lower(cart_table.c.status) == bindparam('status'),
+    'total': lambda: cart_table.c.final_total.between(bindparam('total_min'), bindparam('total_max')),
+    # A range on created rather than DATE(created), so the (buyer_id, created, id) index serves it
+    'date': lambda: and_(cart_table.c.created >= bindparam('date_start'), cart_table.c.created < bindparam('date_end')),
+    'company_name': lambda: func.lower(cart_table.c.customer_company_name).like(bindparam('company_name')),
+    'buyer_area_name': lambda: func.lower(cart_table.c.buyer_area_name).like(bindparam('buyer_area_name')),
+    'order_option': lambda: func.lower(cart_table.c.order_option).like(bindparam('order_option')),
+    'order_id': lambda: cart_table.c.id == bindparam('order_id'),
+}
+
+
+@lru_cache(maxsize=256)
+def sales_order_statement(filters, product_count, keyset, sort_order):
+    """The page query for one shape: which filters apply, the item count, the keyset and the direction.
+
+    Built once per shape, so SQLAlchemy's compiled cache sees the same statement on every request.
+    """
+    direction = SORT_DIRECTIONS[sort_order]
+    conditions = [SALES_ORDER_FILTER_CONDITIONS[name]() for name in filters if name != 'product_names']
+    # The salesman and the cart's items are looked up per cart rather than joined and
+    # grouped, so the (buyer_id, created, id) index drives the ORDER BY and the LIMIT
+    # stops the scan.
+    buyer_id = select(salesman_table.c.id).where(salesman_table.c.username == bindparam('loggedInUsername'))
+    conditions.append(cart_table.c.buyer_id == buyer_id.scalar_subquery())
+    item_conditions = [cart_item_table.c.cart_id == cart_table.c.id]
+    if 'product_names' in filters:
+        item_conditions.append(
+            func.lower(cart_item_table.c.product_name).in_(bindparam('product_names', expanding=True))
+        )
+    conditions.append(exists().where(*item_conditions))
+    if product_count:
+        item_count = select(func.count(cart_item_table.c.id)).where(*item_conditions).scalar_subquery()
+        conditions.append(item_count == bindparam('product_count'))
+
+    # Keyset condition: continue strictly after the last (created, id) of the previous page.
+    # Compared as a row value, so it is a single range on the index instead of an OR.
+    if keyset:
+        position = tuple_(cart_table.c.created, cart_table.c.id)
+        cursor = tuple_(bindparam('cursor_created'), bindparam('cursor_id'))
+        conditions.append(position > cursor if sort_order == 'asc' else position < cursor)
+
+    statement = (
+        select(
+            cart_table.c.id,
+            cart_table.c.created,
+            cart_table.c.status,
+            cart_table.c.customer_company_name,
+            cart_table.c.final_total,
+            cart_table.c.order_option,
+            cart_table.c.buyer_area_name,
+            bindparam('loggedInUsername').label('salesman_username'),
+        )
+        .where(*conditions)
+        .order_by(direction(cart_table.c.created), direction(cart_table.c.id))
+        .limit(bindparam('limit'))
+    )
+    return statement
+
+
+def build_sales_order_query(entities, loggedInUsername, cursor=None):
+    filters, params = [], {}
+
+    # Add conditions based on extracted entities
+    if 'status' in entities:
+        logging.debug("Adding condition for status: %s", entities['status'])
+        filters.append('status')
+        params['status'] = entities['status'].lower()
+
+    if 'total' in entities:
+        tolerance = 0.5
+        total = entities['total']
+        logging.debug("Adding condition for total: %s", total)
+        filters.append('total')
+        params['total_min'] = total - tolerance
+        params['total_max'] = total + tolerance
+
+    if 'date' in entities:
+        logging.debug("Adding condition for date: %s", entities['date'])
+        try:
+            day = date.fromisoformat(str(entities['date']))
+        except ValueError as e:
+            raise ValueError(f"Invalid date: {entities['date']}") from e
+        filters.append('date')
+        # Half-open, so rows stamped in the last fraction of the day still match
+        params['date_start'] = datetime.combine(day, datetime.min.time())
+        params['date_end'] = datetime.combine(day + timedelta(days=1), datetime.min.time())
+
+    if 'company_name' in entities:
+        logging.debug("Adding condition for company name: %s", entities['company_name'])
+        filters.append('company_name')
+        params['company_name'] = f"%{entities['company_name'].lower()}%"
+
+    if 'buyer_area_name' in entities:
+        logging.debug("Adding condition for buyer area: %s", entities['buyer_area_name'])
+        filters.append('buyer_area_name')
+        params['buyer_area_name'] = f"%{entities['buyer_area_name'].lower()}%"
+
+    if 'order_option' in entities:
+        logging.debug("Adding condition for order option: %s", entities['order_option'])
+        filters.append('order_option')
+        params['order_option'] = f"%{entities['order_option'].lower()}%"
+
+    if 'order_id' in entities:
+        logging.debug("Adding condition for order ID: %s", entities['order_id'])
+        filters.append('order_id')
+        params['order_id'] = entities['order_id']
+
+    if 'product_name' in entities:
+        product_name = entities['product_name'].lower()
+        logging.debug("Searching for product name matches: %s", product_name)
+        matched_product_names = cart_item_names.match(product_name)
+        logging.debug("Matched product names: %s", logging_setup.summarize(matched_product_names))
+
+        if matched_product_names:
+            filters.append('product_names')
+            params['product_names'] = list(matched_product_names)
+
+    product_count = 'product_count' in entities
+    if product_count:
+        logging.debug("Adding condition for product count: %s", entities['product_count'])
+        params['product_count'] = entities['product_count']
+
+    # Add condition for loggedInUsername
+    params['loggedInUsername'] = loggedInUsername
+
+    sort_order = str(entities.get('sort_order', 'desc')).lower()
+    if sort_order not in SORT_DIRECTIONS:
+        sort_order = 'desc'
+
+    if cursor is not None:
+        sort_order = cursor['sort_order']
+        params['cursor_created'] = cursor['created']
+        params['cursor_id'] = cursor['id']
+
+    limit = max(1, min(int(entities.get('limit', 10)), SALES_ORDER_MAX_LIMIT))
+    # One extra row tells whether another page follows
+    params['limit'] = limit + 1
+
+    statement = sales_order_statement(tuple(filters), product_count, cursor is not None, sort_order)
+    return statement, params, limit, sort_order
+
+
+@lru_cache(maxsize=2)
+def sales_order_items_statement(filter_products):
+    statement = (
+        select(
+            cart_item_table.c.cart_id,
+            cart_item_table.c.product_name,
+            cart_item_table.c.qty,
+            cart_item_table.c.unit_price,
+            cart_item_table.c.total,
+        )
+        .where(cart_item_table.c.cart_id.in_(bindparam('cart_ids', expanding=True)))
+        .order_by(cart_item_table.c.cart_id, cart_item_table.c.id)
+    )
+    # Keep showing only the matched items when the orders were filtered by product
+    if filter_products:
+        statement = statement.where(
+            func.lower(cart_item_table.c.product_name).in_(bindparam('product_names', expanding=True))
+        )
+    return statement
+
+
+def build_sales_order_items_query(cart_ids, product_names=None):
+    params = {'cart_ids': list(cart_ids)}
+    if product_names:
+        params['product_names'] = list(product_names)
+    return sales_order_items_statement(bool(product_names)), params
+
+
+def encode_sales_order_cursor(created, order_id, sort_order):
+    payload = json.dumps({'created': created.isoformat(sep=' '), 'id': order_id, 'sort_order': sort_order})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_sales_order_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return {
+            'created': datetime.fromisoformat(payload['created']),
+            'id': int(payload['id']),
+            'sort_order': 'asc' if payload['sort_order'] == 'asc' else 'desc'
+        }
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        raise ValueError("Invalid sales order cursor") from e
+
+
+SALES_AGGREGATES = ("top_products", "top_products_by_revenue", "revenue_by_area", "order_count")
+
+
+def process_sales_aggregate_query(entities, loggedInUsername):
     try:
-        logging.debug(f"Processing sales order query with entities: {entities}")
-        conditions, params = [], {}
-
-        # Add conditions based on extracted entities
-        if 'status' in entities:
-            logging.debug(f"Adding condition for status: {entities['status']}")
-            conditions.append("LOWER(cart.status) = :status")
-            params['status'] = entities['status'].lower()
-
-        if 'total' in entities:
-            tolerance = 0.5
-            total = entities['total']
-            logging.debug(f"Adding condition for total: {total}")
-            conditions.append("cart.final_total BETWEEN :total_min AND :total_max")
-            params['total_min'] = total - tolerance
-            params['total_max'] = total + tolerance
-
-        if 'date' in entities:
-            logging.debug(f"Adding condition for date: {entities['date']}")
-            conditions.append("DATE(cart.created) = :date")
-            params['date'] = entities['date']
-
-        if 'company_name' in entities:
-            logging.debug(f"Adding condition for company name: {entities['company_name']}")
-            conditions.append("LOWER(cart.customer_company_name) LIKE :company_name")
-            params['company_name'] = f"%{entities['company_name'].lower()}%"
-
-        if 'buyer_area_name' in entities:
-            logging.debug(f"Adding condition for buyer area: {entities['buyer_area_name']}")
-            conditions.append("LOWER(cart.buyer_area_name) LIKE :buyer_area_name")
-            params['buyer_area_name'] = f"%{entities['buyer_area_name'].lower()}%"
-
-        if 'order_option' in entities:
-            logging.debug(f"Adding condition for order option: {entities['order_option']}")
-            conditions.append("LOWER(cart.order_option) LIKE :order_option")
-            params['order_option'] = f"%{entities['order_option'].lower()}%"
-
-        if 'order_id' in entities:
-            logging.debug(f"Adding condition for order ID: {entities['order_id']}")
-            conditions.append("cart.id = :order_id")
-            params['order_id'] = entities['order_id']
-
-        if 'product_name' in entities:
-            product_name = entities['product_name'].lower()
-            logging.debug(f"Searching for product name matches: {product_name}")
-            all_products_query = """
-                SELECT DISTINCT LOWER(cart_item.product_name)
-                FROM cart_item
-            """
-            all_products = db.session.execute(text(all_products_query)).fetchall()
-            all_product_names = [row[0] for row in all_products]
-
-            matches = process.extract(product_name, all_product_names, scorer=fuzz.partial_ratio, limit=5)
-            matched_product_names = [match[0] for match in matches if match[1] > 90]
-            logging.debug(f"Matched product names: {matched_product_names}")
-
-            if matched_product_names:
-                conditions.append("LOWER(cart_item.product_name) IN :product_names")
-                params['product_names'] = tuple(matched_product_names)
-
-        if 'product_count' in entities:
-            logging.debug(f"Adding condition for product count: {entities['product_count']}")
-            having_clause = "HAVING COUNT(cart_item.id) = :product_count"
-            params['product_count'] = entities['product_count']
+        aggregate = entities['aggregate']
+        filters = {
+            'status': entities.get('status'),
+            'area': entities.get('buyer_area_name'),
+            'day': entities.get('date')
+        }
+        logging.debug("Answering %s from sales aggregates with filters: %s", aggregate, filters)
+
+        if aggregate in ("top_products", "top_products_by_revenue"):
+            by = 'revenue' if aggregate == "top_products_by_revenue" else 'qty'
+            limit = max(1, min(int(entities.get('limit', 5)), SALES_AGGREGATE_MAX_LIMIT))
+            rows = sales_aggregates.top_products(loggedInUsername, limit=limit, by=by, **filters)
+            message = "Here are your top selling products:"
+        elif aggregate == "revenue_by_area":
+            rows = sales_aggregates.revenue_by_area(loggedInUsername, **filters)
+            message = "Here is your revenue by area:"
         else:
-            having_clause = ""
-
-        # Add condition for loggedInUsername
-        conditions.append("salesman.username = :loggedInUsername")
-        params['loggedInUsername'] = loggedInUsername
-
-        # Construct query conditions string
-        query_conditions = " AND ".join(conditions) if conditions else "1=1"
-        limit = entities.get('limit', 10)
-        sort_order = entities.get('sort_order', 'desc')
-
-        # Construct the final query
-        sql_query = f"""
-            SELECT
-                cart.id,
-                cart.created,
-                cart.status,
-                cart.customer_company_name,
-                cart.final_total,
-                GROUP_CONCAT(cart_item.product_name) AS product_names,
-                GROUP_CONCAT(cart_item.qty) AS quantities,
-                GROUP_CONCAT(cart_item.unit_price) AS unit_prices,
-                GROUP_CONCAT(cart_item.total) AS item_totals,
-                cart.order_option,
-                cart.buyer_area_name,
-                salesman.username AS salesman_username
-            FROM
-                cart
-            INNER JOIN
-                cart_item ON cart.id = cart_item.cart_id
-            INNER JOIN
-                salesman ON cart.buyer_id = salesman.id
-            WHERE
-                {query_conditions}
-            GROUP BY
-                cart.id
-            {having_clause}
-            ORDER BY
-                cart.created {sort_order}
-            LIMIT :limit;
-        """
-        params['limit'] = limit
-
-
-        logging.debug(f"Final SQL query: {sql_query} with params: {params}")
-
-        result_set = db.session.execute(text(sql_query), params).fetchall()
-
-        orders = []
-        for row in result_set:
-            row = dict(row._mapping)
-            orders.append({
-                'order_id': row['id'],
-                'company_name': row['customer_company_name'],
-                'created_date': row['created'].strftime('%Y-%m-%d'),
-                'status': row['status'],
-                'total': float(row['final_total']),
-                'order_option': row['order_option'],
-                'buyer_area_name': row['buyer_area_name'],
-                'items': [{
-                    'product_name': name,
-                    'qty': int(qty),
-                    'unit_price': float(price),
-                    'total': float(total)
-                } for name, qty, price, total in zip(row['product_names'].split(','), row['quantities'].split(','), row['unit_prices'].split(','), row['item_totals'].split(','))]
-            })
+            rows = [sales_aggregates.order_count(loggedInUsername, **filters)]
+            message = f"You have {rows[0]['orders']} matching sales orders."
+
+        if not rows:
+            return "No matching sales orders found.", []
+        return message, rows
+
+    except Exception as e:
+        logging.error("Error in processing sales aggregate query: %s", e)
+        return f"Error: {str(e)}", []
+
+
+def as_datetime(value):
+    # SQLite hands DATETIME columns back as text
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def sales_order_row_to_dict(row, items):
+    return {
+        'order_id': row.id,
+        'company_name': row.customer_company_name,
+        'created_date': as_datetime(row.created).strftime('%Y-%m-%d'),
+        'status': row.status,
+        'total': float(row.final_total),
+        'order_option': row.order_option,
+        'buyer_area_name': row.buyer_area_name,
+        'items': items
+    }
+
+
+def fetch_sales_order_page(entities, loggedInUsername, cursor=None):
+    """Phase one: the carts on this page, the product filter, and the cursor of the next page (or None).
+
+    `cursor` is the decoded cursor of the page to continue from, see decode_sales_order_cursor.
+    """
+    sql_query, params, limit, sort_order = build_sales_order_query(entities, loggedInUsername, cursor)
+    logging.debug("Final SQL query: %s with params: %s", logging_setup.summarize(sql_query), logging_setup.summarize(params))
+
+    with metrics.timed("sales_query"):
+        carts = db.session.execute(sql_query, params).fetchall()
+    next_cursor = None
+    if len(carts) > limit:
+        carts = carts[:limit]
+        next_cursor = encode_sales_order_cursor(as_datetime(carts[-1].created), carts[-1].id, sort_order)
+    return carts, params.get('product_names'), next_cursor
+
+
+def iter_sales_orders(carts, product_names=None):
+    """Phase two: read the items of the page's orders, then yield the orders in page order.
+
+    The items come back in cart id order, which is not the page's (created, id) order, so
+    every order is only complete once the whole result has been read.
+    """
+    if not carts:
+        return
+    sql_query, params = build_sales_order_items_query([cart.id for cart in carts], product_names)
+    items = {cart.id: [] for cart in carts}
+
+    result = db.session.execute(sql_query, params, execution_options={'stream_results': True})
+    for cart_id, product_name, qty, unit_price, total in result.yield_per(SALES_ORDER_FETCH_SIZE):
+        items[cart_id].append({
+            'product_name': product_name,
+            'qty': int(qty),
+            'unit_price': float(unit_price),
+            'total': float(total)
+        })
+
+    for cart in carts:
+        yield sales_order_row_to_dict(cart, items[cart.id])
+
+
+def process_sales_order_query(entities, loggedInUsername, cursor=None):
+    try:
+        logging.debug("Processing sales order query with entities: %s", entities)
+        carts, product_names, next_cursor = fetch_sales_order_page(entities, loggedInUsername, cursor)
+        with metrics.timed("sales_items"):
+            orders = list(iter_sales_orders(carts, product_names))
 
         if not orders:
             logging.warning("No matching sales orders found.")
-            return "No matching sales orders found.", []
+            return "No matching sales orders found.", [], None
 
-        logging.debug(f"Found sales orders: {orders}")
-        return "Here are the matching sales orders:", orders
+        logging.debug("Found sales orders: %s", logging_setup.summarize(orders))
+        return "Here are the matching sales orders:", orders, next_cursor
 
     except Exception as e:
-        logging.error(f"Error in processing sales order query: {str(e)}")
-        return f"Error: {str(e)}", []
+        logging.error("Error in processing sales order query: %s", e)
+        return f"Error: {str(e)}", [], None
+
+
+def stream_sales_order_query(entities, loggedInUsername, cursor=None):
+    """Streaming counterpart of process_sales_order_query: the orders come back as an iterator."""
+    carts, product_names, next_cursor = fetch_sales_order_page(entities, loggedInUsername, cursor)
+    if not carts:
+        logging.warning("No matching sales orders found.")
+        return "No matching sales orders found.", iter(()), None
+    return "Here are the matching sales orders:", iter_sales_orders(carts, product_names), next_cursor
+
+
+@app.route('/stats/prompts', methods=['GET'])
+def prompt_stats():
+    return json_response({"prompts": llm.prompt_stats(), "cache": llm.cache_stats()})
+
+
+def llm_metrics():
+    prompts = sorted(llm.prompt_stats().items())
+    collected = [
+        ("llm_calls_total", "counter", "Model calls per prompt.",
+         [({"prompt": name}, stats['calls']) for name, stats in prompts]),
+        ("llm_cache_hits_total", "counter", "Completions served from the response cache, per prompt.",
+         [({"prompt": name}, stats['cache_hits']) for name, stats in prompts]),
+        ("llm_prompt_tokens_total", "counter", "Prompt tokens reported by the model, per prompt.",
+         [({"prompt": name}, stats['prompt_tokens']) for name, stats in prompts]),
+        ("llm_completion_tokens_total", "counter", "Completion tokens reported by the model, per prompt.",
+         [({"prompt": name}, stats['completion_tokens']) for name, stats in prompts]),
+    ]
+    cache = llm.cache_stats()
+    if cache:
+        collected += [
+            ("llm_response_cache_hits_total", "counter", "Response cache hits.", [({}, cache['hits'])]),
+            ("llm_response_cache_misses_total", "counter", "Response cache misses.", [({}, cache['misses'])]),
+            ("llm_response_cache_size", "gauge", "Entries in the response cache.", [({}, cache['size'])]),
+        ]
+    return collected
+
+
+metrics.register_collector(llm_metrics)
+
+
+def sales_order_query_shapes():
+    """Each shape build_sales_order_query can produce, plus the items query, as (name, statement, params)."""
+    username = db.session.execute(text("SELECT username FROM salesman LIMIT 1")).scalar()
+    product_name = db.session.execute(text("SELECT product_name FROM cart_item LIMIT 1")).scalar()
+    created = as_datetime(db.session.execute(text("SELECT MAX(created) FROM cart")).scalar()) or datetime.now()
+    shapes = {
+        "latest": {},
+        "status": {"status": "pending"},
+        "date": {"date": created.date().isoformat()},
+        "total": {"total": 100.0},
+        "company_name": {"company_name": "company"},
+        "buyer_area_name": {"buyer_area_name": "kuching"},
+        "order_option": {"order_option": "urgent"},
+        "order_id": {"order_id": 1},
+        "product_name": {"product_name": product_name or "hammer"},
+        "product_count": {"product_count": 2},
+        "status_and_date": {"status": "pending", "date": created.date().isoformat()},
+    }
+    queries = []
+    for name, entities in shapes.items():
+        statement, params, limit, sort_order = build_sales_order_query(entities, username)
+        queries.append((name, statement, params))
+    statement, params, limit, sort_order = build_sales_order_query(
+        {}, username, {'created': created, 'id': 1, 'sort_order': 'desc'}
+    )
+    queries.append(("next_page", statement, params))
+    statement, params = build_sales_order_items_query([1, 2, 3], [product_name.lower()] if product_name else None)
+    queries.append(("items", statement, params))
+    return queries
+
+
+@app.cli.command('bootstrap-indexes')
+def bootstrap_indexes_command():
+    """Create the generated columns and indexes the search and sales-order queries need."""
+    import schema
+
+    with db.engine.begin() as connection:
+        applied = schema.bootstrap_indexes(connection)
+    for statement in applied:
+        click.echo(statement)
+    click.echo(f"{len(applied)} schema changes applied.")
+
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """EXPLAIN every sales-order query shape and fail if any of them scans a whole table."""
+    import schema
+
+    failures = 0
+    with db.engine.connect() as connection:
+        for name, statement, params in sales_order_query_shapes():
+            scans = schema.explain(connection, statement, params)
+            if scans:
+                failures += 1
+                click.echo(f"FAIL {name}: full scan of {', '.join(scans)}")
+            else:
+                click.echo(f"ok   {name}")
+    if failures:
+        raise SystemExit(1)
+
+
+def warm_caches():
+    """Build the per-process caches up front instead of on the first requests.
+
+    gunicorn.conf.py calls this in the master when the app is preloaded, so every
+    worker forks with the catalog index, the sales caches and the model client ready.
+    """
+    llm.client()
+    for prompt in (PREPROCESS_SYSTEM_PROMPT, SALES_ENTITY_SYSTEM_PROMPT):
+        llm.prompt_version(prompt)
+    try:
+        with app.app_context():
+            product_index.refresh(force=True)
+            cart_item_names.refresh()
+            sales_aggregates.refresh()
+    except Exception as e:
+        logging.warning("Cache warm-up failed, workers will build their caches on first use: %s", e)
+    else:
+        logging.info("Warmed caches: %d catalog products, %d cart item names", len(product_index), len(cart_item_names))
+
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Metrics are kept per process; with several workers each one reports its own.
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/')
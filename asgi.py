@@ -0,0 +1,196 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import aiohttp
+
+import app
+import llm
+import serialization
+
+# SQLAlchemy stays blocking; its work is offloaded to this bounded pool so the event loop
+# only ever waits on it, and each call gets its own timeout.
+DB_THREADS = int(os.getenv('ASGI_DB_THREADS', '32'))
+DB_TIMEOUT = float(os.getenv('ASGI_DB_TIMEOUT', '30'))
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '100'))
+
+db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='db')
+_http_session = None
+
+
+def _get_http_session():
+    # One pooled aiohttp session per process, shared by every OpenAI call.
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=LLM_MAX_CONNECTIONS))
+    return _http_session
+
+
+def _in_app_context(fn, *args):
+    with app.app.app_context():
+        return fn(*args)
+
+
+async def run_db(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(loop.run_in_executor(db_executor, _in_app_context, fn, *args), DB_TIMEOUT)
+
+
+async def detect_intent(user_message):
+    intent_data = app.local_intent(user_message)
+    if intent_data is not None:
+        return intent_data
+
+    combined = app.CHAT_PIPELINE == "combined"
+    completion = app.combined_completion(user_message) if combined else app.intent_completion(user_message)
+    try:
+        intent_data = await llm.acomplete(completion)
+    except asyncio.TimeoutError:
+        # Left to the handler, which answers 504
+        raise
+    except Exception as e:
+        return {"intent": "general", "response": "Hello! How may I assist you today?"}
+    return app.clean_combined_intent(intent_data) if combined else intent_data
+
+
+async def search(search_term, search_attributes=None):
+    if search_attributes is None:
+        try:
+            search_attributes = json.loads(await llm.acomplete(app.preprocess_completion(search_term)))
+        except asyncio.TimeoutError:
+            raise
+        except Exception as e:
+            return 200, {"response": f"Error: {str(e)}", "products": []}
+
+    response_message, matched_products = await run_db(
+        app.handle_search_with_products, search_term, None, None, search_attributes
+    )
+    return 200, {"response": response_message, "products": matched_products if matched_products else []}
+
+
+async def sales_order_inquiry(user_message, loggedInUsername, entities=None, cursor=None):
+    if not user_message:
+        return 400, {"error": "Message is required"}
+
+    if entities is None:
+        try:
+            entities = await llm.acomplete(app.sales_entity_completion(user_message))
+        except json.JSONDecodeError as e:
+            return 400, {"error": "Failed to extract entities from user query"}
+
+    if entities.get('aggregate') in app.SALES_AGGREGATES:
+        response_message, aggregates = await run_db(app.process_sales_aggregate_query, entities, loggedInUsername)
+        await run_db(app.chat_sessions.save, loggedInUsername, entities)
+        return 200, {"response": response_message, "sales_orders": [], "aggregates": aggregates}
+
+    if cursor is not None:
+        try:
+            cursor = app.decode_sales_order_cursor(cursor)
+        except ValueError as e:
+            return 400, {"error": str(e)}
+
+    response_message, sales_orders, next_cursor = await run_db(
+        app.process_sales_order_query, entities, loggedInUsername, cursor
+    )
+    await run_db(app.chat_sessions.save, loggedInUsername, entities, next_cursor)
+    return 200, {"response": response_message, "sales_orders": sales_orders, "next_cursor": next_cursor}
+
+
+async def chat(body):
+    user_message = body.get('message')
+    selected_category = body.get('category')
+    loggedInUsername = body.get('username')
+
+    if selected_category == "sales_order":
+        # The session store may be Redis, so it is read off the event loop like the database
+        follow_up = await run_db(app.chat_sessions.follow_up, loggedInUsername, user_message)
+        if follow_up is not None:
+            if follow_up.exhausted:
+                return 200, {"response": app.NO_MORE_SALES_ORDERS, "sales_orders": [], "next_cursor": None}
+            return await sales_order_inquiry(user_message, loggedInUsername, entities=follow_up.entities,
+                                             cursor=follow_up.cursor)
+
+    intent_data = await detect_intent(user_message)
+    reply = app.chat_reply(intent_data, selected_category)
+    if reply is not None:
+        return 200, reply
+    elif intent_data.get("intent") == "sales_order":
+        return await sales_order_inquiry(user_message, loggedInUsername, entities=intent_data.get("entities"),
+                                         cursor=body.get('cursor'))
+    else:
+        return await search(user_message, search_attributes=intent_data.get("search"))
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+def _json_object(body):
+    try:
+        parsed = json.loads(body or b'null')
+    except ValueError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+async def _send(send, status, body, content_type):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _http_session is not None:
+                await _http_session.close()
+            db_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI entry point serving /chat and /search without holding a worker per request.
+
+    Run with e.g. `uvicorn asgi:application` or gunicorn's uvicorn worker class.
+    """
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    llm.client().aiosession.set(_get_http_session())
+    route = (scope['method'], scope['path'])
+    try:
+        if route == ('POST', '/chat'):
+            body = _json_object(await _read_body(receive))
+            if body is None:
+                status, payload = 400, {"error": "Request body must be a JSON object"}
+            else:
+                status, payload = await chat(body)
+        elif route == ('GET', '/search'):
+            query = parse_qs(scope['query_string'].decode())
+            status, payload = await search(query.get('q', [''])[0])
+        elif route == ('GET', '/'):
+            return await _send(send, 200, app.index().encode(), b'text/html; charset=utf-8')
+        else:
+            status, payload = 404, {"error": "Not found"}
+    except asyncio.TimeoutError:
+        status, payload = 504, {"error": "Request timed out"}
+    except Exception as e:
+        status, payload = 500, {"error": str(e)}
+
+    await _send(send, status, serialization.dumps(payload), b'application/json')
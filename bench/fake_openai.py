@@ -0,0 +1,143 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Phrases that identify each of the app's system prompts.
+COMBINED_MARKER = "In the same JSON object"
+SALES_ENTITY_MARKER = "extract the following entities"
+PREPROCESS_MARKER = "Extract product name, color"
+INTENT_MARKER = "detects the user's intent"
+
+_SEARCH_PREFIX_RE = re.compile(r"^(please\s+)?(search|find|look|looking|show|get)(\s+(me|for|up))*\s+", re.IGNORECASE)
+_LIMIT_RE = re.compile(r"\b(\d+)\b")
+_STATUSES = ("pending", "confirm", "void")
+
+
+def product_from(message):
+    return _SEARCH_PREFIX_RE.sub("", message.strip().rstrip(".?!")).strip() or message
+
+
+def sales_entities(message):
+    entities = {}
+    if "most sold" in message.lower():
+        entities["aggregate"] = "top_products"
+    limit = _LIMIT_RE.search(message)
+    if limit:
+        entities["limit"] = int(limit.group(1))
+    for status in _STATUSES:
+        if status in message.lower():
+            entities["status"] = status
+    return entities
+
+
+def intent(message):
+    if "order" in message.lower() or "sold" in message.lower():
+        return {"intent": "sales_order", "response": "", "category": "sales_order"}
+    return {"intent": "product_search", "response": "", "category": "search_product"}
+
+
+def canned_response(system_prompt, user_content, overrides):
+    """The JSON the app expects for this prompt, answered from the user message alone."""
+    for marker, content in overrides.items():
+        if marker in system_prompt:
+            return content
+    if COMBINED_MARKER in system_prompt:
+        result = intent(user_content)
+        if result["intent"] == "sales_order":
+            result["entities"] = sales_entities(user_content)
+        else:
+            result["search"] = {"product": product_from(user_content), "color": "", "other_attributes": ""}
+        return result
+    if SALES_ENTITY_MARKER in system_prompt:
+        return sales_entities(user_content.removeprefix("Extract entities from this query: "))
+    if PREPROCESS_MARKER in system_prompt:
+        text = user_content.removeprefix("Preprocess this text: ").rstrip(".")
+        return {"product": product_from(text), "color": "", "other_attributes": ""}
+    if INTENT_MARKER in system_prompt:
+        return intent(user_content)
+    return {}
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.5, jitter=0.2, overrides=None):
+        super().__init__(address, FakeOpenAIHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.overrides = overrides or {}
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def delay(self):
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            return self._reply(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        messages = body.get("messages", [])
+        system_prompt = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        user_content = messages[-1]["content"] if messages else ""
+        with self.server._lock:
+            self.server.requests += 1
+
+        time.sleep(self.server.delay())
+        content = json.dumps(canned_response(system_prompt, user_content, self.server.overrides))
+        prompt_tokens = (len(system_prompt) + len(user_content)) // 4
+        completion_tokens = len(content) // 4
+        self._reply(200, {
+            "id": f"chatcmpl-bench-{self.server.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible chat completions stand-in with canned JSON answers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency varies uniformly by up to this many seconds")
+    parser.add_argument("--responses", help="JSON file mapping a system prompt substring to the response to return")
+    args = parser.parse_args()
+
+    overrides = {}
+    if args.responses:
+        with open(args.responses) as f:
+            overrides = json.load(f)
+
+    server = FakeOpenAIServer((args.host, args.port), args.latency, args.jitter, overrides)
+    print(f"OPENAI_API_BASE=http://{args.host}:{args.port}/v1 (latency {args.latency}s +/- {args.jitter}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Served {server.requests} completions")
+
+
+if __name__ == "__main__":
+    main()
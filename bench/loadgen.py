@@ -0,0 +1,135 @@
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from seed import SEARCH_TERMS, STATUSES
+
+SCENARIOS = ("chat", "search", "sales")
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def build_request(base_url, scenario, rng, salesmen):
+    """One request for `scenario` as (method, url, json body or None)."""
+    username = f"salesman{rng.randint(1, salesmen)}"
+    term = rng.choice(SEARCH_TERMS)
+    if scenario == "search":
+        return "GET", f"{base_url}/search?{urllib.parse.urlencode({'q': term})}", None
+    if scenario == "chat":
+        message = rng.choice((f"search for {term}", f"looking for {term}", f"{term}"))
+        return "POST", f"{base_url}/chat", {"message": message, "category": "search_product", "username": username}
+    message = rng.choice((
+        f"last {rng.choice((5, 10, 20))} {rng.choice(STATUSES)} orders",
+        f"show my latest {rng.choice((5, 10))} sales orders",
+        "which is the most sold product",
+    ))
+    return "POST", f"{base_url}/chat", {"message": message, "category": "sales_order", "username": username}
+
+
+def send(method, url, body, timeout):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {scenario: [] for scenario in SCENARIOS}
+        self.errors = {scenario: 0 for scenario in SCENARIOS}
+
+    def record(self, scenario, seconds, ok):
+        with self._lock:
+            self.latencies[scenario].append(seconds)
+            if not ok:
+                self.errors[scenario] += 1
+
+    def summary(self, elapsed):
+        report = {}
+        for scenario, latencies in self.latencies.items():
+            if not latencies:
+                continue
+            report[scenario] = {
+                "requests": len(latencies),
+                "errors": self.errors[scenario],
+                "throughput_rps": round(len(latencies) / elapsed, 2),
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+                "max_ms": round(max(latencies) * 1000, 1),
+            }
+        return report
+
+
+def worker(args, scenarios, deadline, results, worker_id):
+    rng = random.Random(args.seed + worker_id)
+    while time.monotonic() < deadline:
+        scenario = rng.choice(scenarios)
+        method, url, body = build_request(args.url, scenario, rng, args.salesmen)
+        started = time.perf_counter()
+        try:
+            ok = send(method, url, body, args.timeout) < 400
+        except (urllib.error.URLError, OSError):
+            ok = False
+        results.record(scenario, time.perf_counter() - started, ok)
+
+
+def run(args, scenarios, duration):
+    results = Results()
+    deadline = time.monotonic() + duration
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for worker_id in range(args.concurrency):
+            executor.submit(worker, args, scenarios, deadline, results, worker_id)
+    return results.summary(time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive /chat, /search and the sales-order path and report throughput and tail latency.")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of unmeasured load first")
+    parser.add_argument("--salesmen", type=int, default=20, help="usernames salesman1..N, as seeded")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(",") if scenario.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    if args.warmup > 0:
+        run(args, scenarios, args.warmup)
+    report = run(args, scenarios, args.duration)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{'scenario':<10}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for scenario, stats in report.items():
+        print(f"{scenario:<10}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput_rps']:>10}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import argparse
+import os
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+SCHEMA = """
+DROP TABLE IF EXISTS cart_item;
+DROP TABLE IF EXISTS cart;
+DROP TABLE IF EXISTS salesman;
+DROP TABLE IF EXISTS product;
+DROP TABLE IF EXISTS brand;
+DROP TABLE IF EXISTS sub_category;
+DROP TABLE IF EXISTS category;
+
+CREATE TABLE category (id INTEGER PRIMARY KEY, category VARCHAR(255));
+CREATE TABLE sub_category (id INTEGER PRIMARY KEY, sub_category VARCHAR(255), category INTEGER);
+CREATE TABLE brand (id INTEGER PRIMARY KEY, brand VARCHAR(255));
+CREATE TABLE product (
+    id INTEGER PRIMARY KEY,
+    product_name VARCHAR(255) NOT NULL,
+    photo1 VARCHAR(255),
+    photo2 VARCHAR(255),
+    photo3 VARCHAR(255),
+    sub_category INTEGER,
+    brand INTEGER
+);
+CREATE TABLE salesman (id INTEGER PRIMARY KEY, username VARCHAR(255));
+CREATE TABLE cart (
+    id INTEGER PRIMARY KEY,
+    created DATETIME,
+    status VARCHAR(50),
+    customer_company_name VARCHAR(255),
+    final_total DECIMAL(10, 2),
+    order_option VARCHAR(50),
+    buyer_area_name VARCHAR(255),
+    buyer_id INTEGER
+);
+CREATE TABLE cart_item (
+    id INTEGER PRIMARY KEY,
+    cart_id INTEGER,
+    product_name VARCHAR(255),
+    qty INTEGER,
+    unit_price DECIMAL(10, 2),
+    total DECIMAL(10, 2)
+);
+"""
+
+# category -> sub-category -> tool nouns used in product names
+CATALOG = {
+    "Power Tools": {
+        "Drills": ["Drill", "Hammer Drill", "Impact Driver"],
+        "Saws": ["Circular Saw", "Jigsaw", "Mitre Saw"],
+        "Grinders": ["Angle Grinder", "Bench Grinder"],
+    },
+    "Hand Tools": {
+        "Hammers": ["Claw Hammer", "Sledge Hammer", "Rubber Mallet"],
+        "Wrenches": ["Adjustable Wrench", "Pipe Wrench", "Spanner Set"],
+        "Screwdrivers": ["Screwdriver", "Screwdriver Set"],
+    },
+    "Plumbing": {
+        "Pipes": ["PVC Pipe", "Copper Pipe"],
+        "Valves": ["Ball Valve", "Gate Valve"],
+    },
+    "Paint": {
+        "Wall Paint": ["Emulsion Paint", "Primer"],
+        "Brushes": ["Paint Brush", "Paint Roller"],
+    },
+}
+BRANDS = ["Bosch", "Makita", "Stanley", "DeWalt", "Tolsen", "Ingco", "Total", "Nippon", "Dulux", "Hitachi"]
+ADJECTIVES = ["Cordless", "Heavy Duty", "Compact", "Professional", "Industrial", "Mini", "Pro"]
+COLORS = ["Red", "Blue", "Black", "Yellow", "Green", "White"]
+SIZES = ["16oz", "18V", "12V", "800W", "1200W", '1/2"', '3/4"', "10mm", "20mm", "1L", "5L"]
+STATUSES = ["pending", "confirm", "void"]
+ORDER_OPTIONS = ["Urgent", "Credit Term", "Cash"]
+AREAS = ["Kuching", "Miri", "Sibu", "Bintulu", "Samarahan", "Sri Aman"]
+
+# Terms the load driver searches for; all of them occur in the seeded catalog.
+SEARCH_TERMS = sorted({noun.split()[-1].lower() for subs in CATALOG.values() for nouns in subs.values() for noun in nouns}
+                      | {brand.lower() for brand in BRANDS})
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def product_rows(rng, count, sub_categories):
+    for product_id in range(1, count + 1):
+        sub_category_id, nouns = rng.choice(sub_categories)
+        brand_id = rng.randrange(len(BRANDS)) + 1
+        name = " ".join(part for part in (
+            rng.choice(ADJECTIVES) if rng.random() < 0.5 else None,
+            rng.choice(nouns),
+            rng.choice(SIZES) if rng.random() < 0.6 else None,
+            rng.choice(COLORS).upper() if rng.random() < 0.3 else None,
+            f"#{product_id}",
+        ) if part)
+        photo = f"photo/{product_id}.jpg" if rng.random() < 0.7 else None
+        yield product_id, name, photo, None, None, sub_category_id, brand_id
+
+
+def cart_rows(rng, count, salesmen, start):
+    for cart_id in range(1, count + 1):
+        created = start + timedelta(minutes=rng.randrange(365 * 24 * 60))
+        yield (cart_id, created.strftime("%Y-%m-%d %H:%M:%S"), rng.choice(STATUSES),
+               f"Company {rng.randrange(max(count // 20, 1))}", 0, rng.choice(ORDER_OPTIONS),
+               rng.choice(AREAS), rng.randrange(salesmen) + 1)
+
+
+def seed(path, products, carts, salesmen, items_per_cart, random_seed=42, batch_size=10000):
+    rng = random.Random(random_seed)
+    if os.path.exists(path):
+        os.remove(path)
+    con = sqlite3.connect(path)
+    con.executescript(SCHEMA)
+
+    sub_categories = []
+    for category_id, (category, subs) in enumerate(CATALOG.items(), start=1):
+        con.execute("INSERT INTO category VALUES (?, ?)", (category_id, category))
+        for sub_category, nouns in subs.items():
+            sub_category_id = len(sub_categories) + 1
+            con.execute("INSERT INTO sub_category VALUES (?, ?, ?)", (sub_category_id, sub_category, category_id))
+            sub_categories.append((sub_category_id, nouns))
+    con.executemany("INSERT INTO brand VALUES (?, ?)", enumerate(BRANDS, start=1))
+    con.executemany("INSERT INTO salesman VALUES (?, ?)",
+                    ((i, f"salesman{i}") for i in range(1, salesmen + 1)))
+
+    names = []
+    for chunk in chunked(product_rows(rng, products, sub_categories), batch_size):
+        con.executemany("INSERT INTO product VALUES (?, ?, ?, ?, ?, ?, ?)", chunk)
+        # Orders draw from a few hundred popular products, as real order history does.
+        names.extend(row[1] for row in chunk if len(names) < 500)
+
+    item_id = 0
+    start = datetime(2024, 1, 1)
+    for chunk in chunked(cart_rows(rng, carts, salesmen, start), batch_size):
+        items = []
+        totals = {}
+        for cart in chunk:
+            for _ in range(rng.randint(1, items_per_cart * 2 - 1)):
+                item_id += 1
+                qty = rng.randint(1, 20)
+                unit_price = round(rng.uniform(2, 500), 2)
+                items.append((item_id, cart[0], rng.choice(names), qty, unit_price, round(qty * unit_price, 2)))
+                totals[cart[0]] = totals.get(cart[0], 0) + qty * unit_price
+        con.executemany("INSERT INTO cart VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        [cart[:4] + (round(totals[cart[0]], 2),) + cart[5:] for cart in chunk])
+        con.executemany("INSERT INTO cart_item VALUES (?, ?, ?, ?, ?, ?)", items)
+
+    con.commit()
+    con.close()
+    return item_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a SQLite database with a synthetic SalesNavigator catalog and order history.")
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(__file__), "bench.db"))
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--carts", type=int, default=10000)
+    parser.add_argument("--salesmen", type=int, default=20)
+    parser.add_argument("--items-per-cart", type=int, default=3, help="average cart_item rows per cart")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    items = seed(args.db, args.products, args.carts, args.salesmen, args.items_per_cart, args.seed)
+    print(f"Seeded {args.db}: {args.products} products, {args.carts} carts, {items} cart items, "
+          f"{args.salesmen} salesmen (salesman1..salesman{args.salesmen})")
+    print(f"DATABASE_URL=sqlite:///{os.path.abspath(args.db)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import math
+import re
+from collections import Counter
+
+from rapidfuzz import fuzz, process
+
+# Question/answer pairs the assistant answers for the `general` intent.
+FAQ = [
+    ('What products does Sales Navigator Online Store offer?',
+     'Sales Navigator Online Store specializes in products like mechanical scales, digital scales, hardware tools, power tools, food processing machinery, agriculture tools and equipment, industrial tools and machinery, construction tools and materials, and automotive products.'),
+    ('How long has Sales Navigator Online Store been in business?',
+     'Sales Navigator Online Store, run by Fong Yuan Hung Import and Export Sdn. Bhd., has been serving customers since 1980.'),
+    ("Where is Sales Navigator Online Store's market located?",
+     'Our primary market is in East Malaysia, covering Sarawak and Sabah.'),
+    ('From which countries does Sales Navigator Online Store import products?',
+     'We import products from countries like China, Taiwan, South Korea, Thailand, Vietnam, the Philippines, India, the UK, Australia, and New Zealand.'),
+    ('How can I contact Sales Navigator Online Store for more information?',
+     'For support, email us at support@questmarketing.com.my. For business inquiries, use the contact details on our website.'),
+    ('What is the annual import volume of Sales Navigator Online Store?',
+     'We import approximately 10-15 containers (20 feet each) of goods annually.'),
+    ('What product categories are available?',
+     'We offer: Weighing Equipment, Agriculture Tools, Construction Materials, Industrial Machinery, General Hardware, Automotive Products.'),
+    ('Can customers create an account on the website?',
+     'Account creation is restricted to admins and salesmen only. Customers can browse and place orders without creating an account.'),
+    ('What should I do if I forgot my password?',
+     'Salesmen should contact the admin to reset their password at support@questmarketing.com.my.'),
+    ('How do I change my password?',
+     'Salesmen need to email the admin at support@questmarketing.com.my to request a password change.'),
+    ('Who can access the admin features?',
+     'Only authorized admins and salesmen can access admin features. Contact your admin for permissions.'),
+    ('How do I place an order?',
+     'Add products to your cart on our website and proceed to checkout. For assistance, contact our sales team.'),
+    ('What are the payment methods available?',
+     'We accept credit/debit cards, bank transfers, and online payment gateways.'),
+    ('How can I track my order status?',
+     "You'll receive a tracking number via email after placing an order. Use it to track your order on our website."),
+    ('What is your return and exchange policy?',
+     'We offer returns and exchanges for defective or damaged products. Check our terms and conditions or contact support.'),
+    ('How can I contact customer service?',
+     'Email us at support@questmarketing.com.my or use the contact form on our website.'),
+    ('Are there any shipping charges?',
+     'Shipping charges depend on order size and destination. The cost is calculated during checkout.'),
+    ('Do you ship internationally?',
+     'Our primary market is East Malaysia, but we may accommodate international shipping requests. Contact customer service for details.'),
+    ('Can I cancel or modify my order after placing it?',
+     'You can modify or cancel orders within a limited timeframe. Contact customer service as soon as possible.'),
+    ('What warranties do you offer on your products?',
+     "Most products come with a manufacturer's warranty. Check product details or contact support for warranty information."),
+    ('How do I register an account on your website?',
+     "Click on 'Sign In' and select 'Create an Account'. Follow the prompts to complete registration."),
+    ('How do I log in to the admin or salesman portal?',
+     "The login portal is for admins and salesmen only. Click on 'Sign In' on the homepage and enter your credentials."),
+    ('Are there any promotions or discounts available?',
+     'Yes, we offer regular promotions and discounts. Check the promotions page or contact our sales team.'),
+    ('How can I check the availability of a specific product?',
+     'Search for the product on our website or contact customer service with the product name or ID.'),
+    ('Do you offer bulk purchase discounts?',
+     'Yes, we provide bulk purchase discounts. Contact our sales team for details.'),
+    ('Can I get a product demo or sample before purchasing?',
+     'We may offer demos or samples for certain products. Contact our sales team to inquire.'),
+    ('How do I become a distributor for Sales Navigator products?',
+     'Fill out the distributor application on our website or contact our business development team.'),
+]
+
+_PUNCTUATION_RE = re.compile(r"[^a-z0-9@.' ]+")
+
+
+def normalize_question(text):
+    return " ".join(_PUNCTUATION_RE.sub(" ", (text or "").lower()).split()).strip(" .")
+
+
+_QUESTION_KEYS = [normalize_question(question) for question, answer in FAQ]
+
+
+def match_faq(message, score_cutoff=90):
+    """Return the answer whose question `message` restates almost verbatim, or None."""
+    match = process.extractOne(normalize_question(message), _QUESTION_KEYS, scorer=fuzz.ratio,
+                               processor=None, score_cutoff=score_cutoff)
+    if match is None:
+        return None
+    return FAQ[match[2]][1]
+
+
+_STOPWORDS = frozenset(
+    "a an and are any at be by can do does for from how i in is it me my of on or our the to "
+    "what when where which who why with you your".split()
+)
+
+
+def _terms(text):
+    return [term for term in re.findall(r"[a-z0-9]+", (text or "").lower()) if term not in _STOPWORDS]
+
+
+class FaqRetriever:
+    """BM25 over the FAQ entries, with question terms counted twice so they outweigh the answer."""
+
+    def __init__(self, entries, k1=1.2, b=0.75):
+        self.entries = entries
+        self._k1 = k1
+        self._b = b
+        self._docs = [Counter(_terms(question) * 2 + _terms(answer)) for question, answer in entries]
+        self._lengths = [sum(doc.values()) for doc in self._docs]
+        self._average_length = sum(self._lengths) / max(len(self._docs), 1)
+        document_frequency = Counter(term for doc in self._docs for term in doc)
+        self._idf = {
+            term: math.log(1 + (len(self._docs) - count + 0.5) / (count + 0.5))
+            for term, count in document_frequency.items()
+        }
+
+    def retrieve(self, message, limit=3):
+        """The `limit` entries most relevant to `message`, best first; entries sharing no term are left out."""
+        terms = set(_terms(message)) & self._idf.keys()
+        scored = []
+        for position, doc in enumerate(self._docs):
+            norm = self._k1 * (1 - self._b + self._b * self._lengths[position] / self._average_length)
+            score = sum(self._idf[term] * doc[term] * (self._k1 + 1) / (doc[term] + norm) for term in terms if term in doc)
+            if score > 0:
+                scored.append((score, position))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [self.entries[position] for score, position in scored[:limit]]
+
+
+retriever = FaqRetriever(FAQ)
+
+
+def render_faq(entries=FAQ, indent=""):
+    return "\n".join(f'{indent}("{question} {answer}"),' for question, answer in entries)
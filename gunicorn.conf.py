@@ -0,0 +1,41 @@
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+# Import the app once in the master and fork the workers from it, so they share its
+# modules and warmed caches copy-on-write instead of each building their own. The
+# caches are only shared until a worker's first rebuild replaces them (see README).
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+
+def on_starting(server):
+    if server.cfg.preload_app:
+        # No collections in the master until the warm objects are frozen below.
+        gc.disable()
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    import app
+
+    app.warm_caches()
+    # Moves everything built so far out of the collector's reach, so collections in
+    # the workers never write to (and so copy) the pages shared with the master.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if not server.cfg.preload_app:
+        return
+    gc.enable()
+
+    import app
+    import logging_setup
+
+    # Connections the master opened while warming must not be shared between workers.
+    with app.app.app_context():
+        app.db.engine.dispose(close=False)
+    # The log listener thread does not survive the fork.
+    logging_setup.configure()
@@ -0,0 +1,60 @@
+import re
+
+from faq import match_faq, retriever
+
+GREETING_RESPONSE = "Hello! How may I assist you today?"
+
+_GREETING_RE = re.compile(
+    r"^(hi+|hello+|hey+|hai|helo|greetings|good (morning|afternoon|evening|day)|"
+    r"assalamualaikum|salam)( there| agent| smart agent)?[!. ]*$"
+)
+_THANKS_RE = re.compile(r"^(thanks?( you)?|thank u|ty|cheers)( so much| a lot)?[!. ]*$")
+_SALES_ORDER_RE = re.compile(
+    r"\bsales? orders?\b|\bmost sold\b|\bbest sell(ing|er)\b|"
+    r"\b(last|first|latest|recent)( \d+)?( (pending|void|confirm(ed)?|complete(d)?))? orders?\b"
+)
+# A listing verb followed directly by the orders it lists. "show me how to place an order"
+# or "give me the order form" are FAQ and how-to questions, so the orders must come with a
+# listing cue: "my", a status, last/latest/first, or a number next to them.
+_ORDER_LISTING_RE = re.compile(
+    r"^(search|find|show|list|get|display|give)( me)?( for)?( all)?( the)?(?P<my> my)?"
+    r"(?P<when> (last|latest|first))?(?P<count> \d+)?(?P<status> (pending|void|confirm(ed)?|complete(d)?))?"
+    r" orders?(?P<id> #?\d+)?\b"
+)
+# Only unambiguous search verbs; "i need", "show me" or "do you have" also open FAQ questions.
+_PRODUCT_SEARCH_RE = re.compile(r"^(search( for)?|looking for|look for|find me)\s+(?P<terms>.+)$")
+_ORDER_WORD_RE = re.compile(r"\borders?\b")
+
+
+def _is_order_listing(text):
+    match = _ORDER_LISTING_RE.match(text)
+    return match is not None and any(match.group(cue) for cue in ("my", "when", "count", "status", "id"))
+
+
+def classify(message):
+    """Classify the obvious messages locally, or return None to defer to the model.
+
+    Returns the same {"intent", "response", "category"} shape as the model does.
+    """
+    text = " ".join(str(message or "").lower().split())
+    if not text:
+        return None
+
+    if _GREETING_RE.match(text):
+        return {"intent": "general", "response": GREETING_RESPONSE, "category": None}
+    if _THANKS_RE.match(text):
+        return {"intent": "general", "response": "You're welcome! Is there anything else I can help with?", "category": None}
+
+    answer = match_faq(text)
+    if answer is not None:
+        return {"intent": "general", "response": answer, "category": None}
+
+    if _SALES_ORDER_RE.search(text) or _is_order_listing(text):
+        return {"intent": "sales_order", "response": "", "category": None}
+    # Any mention of an order belongs to the sales-order flow, and anything the FAQ
+    # covers ("search for your return policy") may be a question, so leave those to the model.
+    match = _PRODUCT_SEARCH_RE.match(text)
+    if match and not _ORDER_WORD_RE.search(text) and not retriever.retrieve(match.group("terms"), 1):
+        return {"intent": "product_search", "response": "", "category": None}
+
+    return None
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+from cache import TTLCache
+
+MODEL = "gpt-4o-mini"
+
+# Seconds before a model call is abandoned, for both the blocking and the async client.
+TIMEOUT = float(os.getenv('LLM_TIMEOUT', '30'))
+
+# Completions keyed on (prompt version, normalized user message). Replace with any object
+# exposing the TTLCache get/set interface, or set to None to always call the model.
+response_cache = TTLCache(
+    maxsize=int(os.getenv('LLM_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('LLM_CACHE_TTL', '3600'))
+)
+
+# One model call: the prompts and sampling settings, the message used as cache key (None
+# disables caching), an optional parse hook applied to the returned content and the name
+# its token usage is reported under.
+Completion = namedtuple(
+    'Completion',
+    ['system_prompt', 'user_content', 'max_tokens', 'temperature', 'cache_key', 'parse', 'name'],
+    defaults=[None, None, 'completion']
+)
+
+_stats_lock = threading.Lock()
+_prompt_stats = {}
+
+
+def normalize_message(message):
+    return " ".join(str(message or "").lower().split())
+
+
+_openai = None
+
+
+def client():
+    """The openai module, imported on first use since requests answered locally never need it."""
+    global _openai
+    if _openai is None:
+        import openai
+        openai.api_key = os.getenv("OPENAI_API_KEY", "")
+        _openai = openai
+    return _openai
+
+
+@lru_cache(maxsize=256)
+def prompt_version(system_prompt):
+    return hashlib.sha1(system_prompt.encode('utf-8')).hexdigest()[:12]
+
+
+def json_content(content):
+    """Parse hook for callers that want the raw content, but only once it is valid JSON."""
+    json.loads(content)
+    return content
+
+
+def _cache_key(completion):
+    if completion.cache_key is None or response_cache is None:
+        return None
+    return (prompt_version(completion.system_prompt), completion.max_tokens, normalize_message(completion.cache_key))
+
+
+def _parse(completion, content):
+    return completion.parse(content) if completion.parse else content
+
+
+def _request_args(completion):
+    return dict(
+        model=MODEL,
+        messages=[
+            {"role": "system", "content": completion.system_prompt},
+            {"role": "user", "content": completion.user_content}
+        ],
+        max_tokens=completion.max_tokens,
+        temperature=completion.temperature,
+        request_timeout=TIMEOUT,
+    )
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English prompts; the model reports exact counts.
+    return (len(text) + 3) // 4
+
+
+def _record(completion, response=None, seconds=0.0):
+    usage = response.get('usage', {}) if response is not None else {}
+    estimated = estimate_tokens(completion.system_prompt) + estimate_tokens(completion.user_content)
+    with _stats_lock:
+        stats = _prompt_stats.setdefault(completion.name, {
+            'calls': 0, 'cache_hits': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+            'estimated_prompt_tokens': 0, 'last_prompt_tokens': 0, 'seconds': 0.0
+        })
+        if response is None:
+            stats['cache_hits'] += 1
+            return
+        stats['calls'] += 1
+        stats['prompt_tokens'] += usage.get('prompt_tokens', 0)
+        stats['completion_tokens'] += usage.get('completion_tokens', 0)
+        stats['estimated_prompt_tokens'] += estimated
+        stats['last_prompt_tokens'] = usage.get('prompt_tokens', estimated)
+        stats['seconds'] += seconds
+    logging.info("llm %s: prompt_tokens=%s completion_tokens=%s estimated_prompt_tokens=%d latency_ms=%.0f",
+                 completion.name, usage.get('prompt_tokens'), usage.get('completion_tokens'), estimated, seconds * 1000)
+
+
+def _finish(completion, key, response):
+    content = response['choices'][0]['message']['content'].strip()
+    result = _parse(completion, content)
+    if key is not None:
+        response_cache.set(key, content)
+    return result
+
+
+def complete(completion):
+    """Run one chat completion and return its content, passed through `parse` if given.
+
+    When the completion has a cache key the content is cached under the prompt version
+    and the normalized key, so repeated messages skip the model round trip. Content is
+    cached only once it has parsed, and is parsed again on every hit so callers always
+    get fresh objects.
+    """
+    key = _cache_key(completion)
+    if key is not None:
+        cached = response_cache.get(key)
+        if cached is not None:
+            _record(completion)
+            return _parse(completion, cached)
+
+    started = time.perf_counter()
+    response = client().ChatCompletion.create(**_request_args(completion))
+    _record(completion, response, time.perf_counter() - started)
+    return _finish(completion, key, response)
+
+
+async def acomplete(completion):
+    """Async counterpart of `complete`, using the aiohttp session set in `openai.aiosession`."""
+    key = _cache_key(completion)
+    if key is not None:
+        cached = response_cache.get(key)
+        if cached is not None:
+            _record(completion)
+            return _parse(completion, cached)
+
+    started = time.perf_counter()
+    response = await asyncio.wait_for(client().ChatCompletion.acreate(**_request_args(completion)), TIMEOUT)
+    _record(completion, response, time.perf_counter() - started)
+    return _finish(completion, key, response)
+
+
+def prompt_stats():
+    """Per prompt name: model calls, cache hits, reported and estimated tokens, and time spent."""
+    with _stats_lock:
+        return {name: dict(stats) for name, stats in _prompt_stats.items()}
+
+
+def cache_stats():
+    return response_cache.stats() if response_cache is not None else {}
@@ -0,0 +1,138 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# "json" writes one JSON object per line; "text" keeps the plain format for local runs.
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+# Share of requests whose DEBUG/INFO records are kept, per route, e.g. "/chat=0.1,*=0.5".
+# Warnings and errors are always kept.
+LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', '')
+# Longest rendering of a payload passed through summarize().
+LOG_MAX_CHARS = int(os.getenv('LOG_MAX_CHARS', '500'))
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'route'}
+
+_listener = None
+
+
+def parse_sample_rates(spec):
+    rates = {}
+    for part in spec.split(','):
+        route, _, rate = part.strip().partition('=')
+        if route and rate:
+            rates[route] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+sample_rates = parse_sample_rates(LOG_SAMPLE_RATES)
+
+
+class Summary:
+    """Renders `value` only when a record is actually written, and at most `limit` characters of it."""
+
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value, limit=None):
+        self.value = value
+        self.limit = limit or LOG_MAX_CHARS
+
+    def __str__(self):
+        text = str(self.value)
+        if len(text) <= self.limit:
+            return text
+        size = f" ({len(self.value)} items)" if isinstance(self.value, (list, tuple, dict, set)) else ""
+        return f"{text[:self.limit]}...{size} [{len(text)} chars]"
+
+
+def summarize(value, limit=None):
+    return Summary(value, limit)
+
+
+def sample_request():
+    """Decide once per request whether its low-level records are kept, so a kept request logs in full."""
+    route = request.url_rule.rule if request.url_rule is not None else None
+    rate = sample_rates.get(route, sample_rates.get('*', 1.0))
+    g.log_sampled = rate >= 1.0 or random.random() < rate
+    g.log_route = route
+
+
+class RequestSampleFilter(logging.Filter):
+    def filter(self, record):
+        if not has_request_context():
+            return True
+        # Tagged here because the record is written on the listener thread, outside the request.
+        record.route = g.get('log_route')
+        return record.levelno >= logging.WARNING or g.get('log_sampled', True)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queues the record as is, so its message is formatted on the listener thread.
+
+    The stock QueueHandler formats in the calling thread to make records safe to pickle;
+    the queue here never leaves the process, so that work stays off the request.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        route = getattr(record, 'route', None)
+        if route:
+            entry['route'] = route
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure():
+    """Route the root logger through a queue to a stream handler on a background thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    stream = logging.StreamHandler(sys.stderr)
+    if LOG_FORMAT == 'json':
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter('%(levelname)s:%(name)s:%(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    handler = DeferredQueueHandler(log_queue)
+    handler.addFilter(RequestSampleFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(LOG_LEVEL)
+
+    _listener = QueueListener(log_queue, stream)
+    _listener.start()
+
+
+def stop():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop)
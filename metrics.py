@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+PREFIX = "salesnav_"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+# Quantiles are computed over the most recent observations of each series.
+QUANTILE_WINDOW = 1024
+
+HELP = {
+    "stage_duration_seconds": "Time spent in each stage of request handling.",
+    "http_request_duration_seconds": "Time to produce a response, per route.",
+    "http_requests_total": "Responses sent, per route and status code.",
+}
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_collectors = []
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=QUANTILE_WINDOW):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[position] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def quantile(self, q):
+        if not self.recent:
+            return 0.0
+        values = sorted(self.recent)
+        return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def observe(name, value, **labels):
+    with _lock:
+        key = (name, _labels_key(labels))
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(value)
+
+
+def inc(name, amount=1, **labels):
+    with _lock:
+        key = (name, _labels_key(labels))
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def register_collector(collector):
+    """`collector()` returns (name, type, help, [(labels, value), ...]) tuples read at scrape time."""
+    _collectors.append(collector)
+
+
+@contextmanager
+def timed(stage):
+    """Record how long the block took as `stage`, and add it to the response's Server-Timing."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        observe("stage_duration_seconds", seconds, stage=stage)
+        if has_request_context():
+            g.setdefault('server_timing', []).append((stage, seconds))
+
+
+def server_timing_header(timings):
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        histograms = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+
+        seen = set()
+        for (name, labels), histogram in histograms:
+            metric = PREFIX + name
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {metric} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {metric} histogram")
+            for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                lines.append(f"{metric}_bucket{_format_labels(labels, le=bound)} {count}")
+            lines.append(f"{metric}_bucket{_format_labels(labels, le='+Inf')} {histogram.count}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {histogram.sum}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {histogram.count}")
+
+        # The same series as summaries, so p50/p95/p99 can be read without a Prometheus server.
+        seen = set()
+        for (name, labels), histogram in histograms:
+            metric = PREFIX + name.replace("_seconds", "_quantile_seconds")
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {metric} Recent quantiles of {PREFIX + name}.")
+                lines.append(f"# TYPE {metric} summary")
+            for q in QUANTILES:
+                lines.append(f"{metric}{_format_labels(labels, quantile=q)} {histogram.quantile(q)}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {histogram.sum}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {histogram.count}")
+
+        seen = set()
+        for (name, labels), value in counters:
+            metric = PREFIX + name
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {metric} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+    for collector in _collectors:
+        for name, metric_type, help_text, samples in collector():
+            metric = PREFIX + name
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{metric}{_format_labels(_labels_key(labels))} {value}")
+
+    return "\n".join(lines) + "\n"
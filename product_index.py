@@ -0,0 +1,204 @@
+import logging
+import math
+import re
+import threading
+import time
+
+from rapidfuzz import fuzz, process
+
+# Relative weight of a term hit in each indexed field of a catalog product.
+FIELD_WEIGHTS = (
+    ('product_name', 3.0),
+    ('brand', 2.0),
+    ('sub_category', 1.5),
+    ('category', 1.0),
+)
+SUBSTRING_HIT_WEIGHT = 0.6
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize_name(name):
+    return " ".join((name or "").lower().split())
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class CatalogProduct:
+    """One indexed catalog row, with its photo URLs already resolved."""
+
+    __slots__ = ('id', 'product_name', 'photo1', 'photo2', 'photo3', 'sub_category', 'category', 'brand')
+
+    def __init__(self, row, photo_url=None):
+        (self.id, self.product_name, photo1, photo2, photo3,
+         self.sub_category, self.category, self.brand) = row
+        if photo_url is not None:
+            photo1, photo2, photo3 = photo_url(photo1), photo_url(photo2), photo_url(photo3)
+        self.photo1, self.photo2, self.photo3 = photo1, photo2, photo3
+
+
+class _Catalog:
+    """One snapshot of the catalog: rows by slot plus the token and trigram postings."""
+
+    def __init__(self):
+        self.rows = []
+        self.keys = []
+        self.slots = {}
+        self.postings = {}
+        self.trigrams = {}
+
+    def add(self, row):
+        slot = len(self.rows)
+        self.rows.append(row)
+        self.keys.append(normalize_name(row.product_name))
+        self.slots[row.id] = slot
+        for field, weight in FIELD_WEIGHTS:
+            for token in tokenize(getattr(row, field)):
+                postings = self.postings.get(token)
+                if postings is None:
+                    postings = self.postings[token] = {}
+                    for gram in trigrams(token):
+                        self.trigrams.setdefault(gram, set()).add(token)
+                postings[slot] = max(postings.get(slot, 0.0), weight)
+
+    def matching_tokens(self, term):
+        """Vocabulary tokens containing `term`, each flagged with whether it is an exact hit."""
+        if len(term) < 3:
+            candidates = (token for token in self.postings if term in token)
+        else:
+            grams = sorted((self.trigrams.get(gram, ()) for gram in trigrams(term)), key=len)
+            candidates = (token for token in grams[0] if term in token)
+        return [(token, token == term) for token in candidates]
+
+    def score(self, terms):
+        """Relevance score per slot for the slots that match every term."""
+        scores = None
+        total = max(len(self.slots), 1)
+        for term in terms:
+            term_scores = {}
+            for token, exact in self.matching_tokens(term):
+                postings = self.postings[token]
+                idf = math.log(1 + total / len(postings))
+                factor = idf if exact else idf * SUBSTRING_HIT_WEIGHT
+                for slot, weight in postings.items():
+                    score = weight * factor
+                    if score > term_scores.get(slot, 0.0):
+                        term_scores[slot] = score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {slot: scores[slot] + score for slot, score in term_scores.items() if slot in scores}
+            if not scores:
+                break
+        return scores or {}
+
+
+class ProductIndex:
+    """In-memory catalog index used for ranked product search and the fuzzy fallback.
+
+    `loader` returns catalog rows as (id, product_name, photo1, photo2, photo3,
+    sub_category, category, brand) and `signature` returns a cheap value that changes
+    when products are added or deleted. Rows are kept as CatalogProduct objects, with each
+    photo passed through `photo_url` once when it is indexed. The signature is polled at most every `check_interval`
+    seconds and the index is rebuilt when it differs from the one seen at the last
+    build. Edits to existing rows do not change the signature, so the index is also
+    rebuilt once it is `max_age` seconds old. Only the first build runs in the caller;
+    later ones run on a background thread, inside `context()` when given, and are
+    swapped in whole while searches keep reading the previous snapshot.
+
+    Terms are looked up in a token inverted index; a term that is not a whole token
+    is matched as a substring of vocabulary tokens found through their trigrams, which
+    keeps the old LIKE '%term%' behaviour without scanning the catalog.
+    """
+
+    def __init__(self, loader, signature, check_interval=60, max_age=900, photo_url=None, context=None):
+        self._loader = loader
+        self._signature = signature
+        self._check_interval = check_interval
+        self._max_age = max_age
+        self._photo_url = photo_url
+        self._context = context
+        self._lock = threading.Lock()
+        self._built_signature = None
+        self._checked_at = 0.0
+        self._built_at = 0.0
+        self._rebuilding = False
+        self._catalog = _Catalog()
+
+    def __len__(self):
+        return len(self._catalog.slots)
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self._built_signature is not None and now - self._checked_at < self._check_interval:
+            return
+        with self._lock:
+            if not force and self._built_signature is not None and now - self._checked_at < self._check_interval:
+                return
+            signature = self._signature()
+            self._checked_at = now
+            if force or self._built_signature is None:
+                # Nothing to search yet, or the caller asked to wait for the build.
+                self._swap(self._load(), signature, now)
+            elif not self._rebuilding and (signature != self._built_signature or now - self._built_at >= self._max_age):
+                self._rebuilding = True
+                threading.Thread(target=self._rebuild, args=(signature, now),
+                                 name='product-index', daemon=True).start()
+
+    def _load(self):
+        catalog = _Catalog()
+        for row in self._loader():
+            catalog.add(CatalogProduct(row, self._photo_url))
+        return catalog
+
+    def _swap(self, catalog, signature, started):
+        # Swapped in whole so concurrent readers never see a partial build; a build
+        # started before the current snapshot was taken is dropped.
+        if started >= self._built_at:
+            self._catalog = catalog
+            self._built_signature = signature
+            self._built_at = started
+
+    def _rebuild(self, signature, started):
+        try:
+            if self._context is not None:
+                with self._context():
+                    catalog = self._load()
+            else:
+                catalog = self._load()
+            with self._lock:
+                self._swap(catalog, signature, started)
+        except Exception:
+            logging.exception("Rebuilding the product index failed")
+        finally:
+            self._rebuilding = False
+
+    def search(self, query, color=None, limit=50):
+        """Return catalog products containing every term of `query`, best matches first."""
+        self.refresh()
+        catalog = self._catalog
+        rows = catalog.rows
+        terms = tokenize(query)
+        if terms:
+            scores = catalog.score(terms)
+            ranked = [rows[slot] for slot in sorted(scores, key=lambda slot: (-scores[slot], rows[slot].product_name or ""))]
+        else:
+            ranked = sorted(rows, key=lambda row: row.product_name or "")
+        if color:
+            color = color.lower()
+            ranked = [row for row in ranked if color in (row.product_name or "").lower()]
+        return ranked[:limit]
+
+    def fuzzy_search(self, query, limit=5, score_cutoff=70):
+        """Return catalog products whose name scores above `score_cutoff`."""
+        self.refresh()
+        catalog = self._catalog
+        matches = process.extract(normalize_name(query), catalog.keys, scorer=fuzz.partial_ratio,
+                                  processor=None, score_cutoff=score_cutoff, limit=limit)
+        return [catalog.rows[i] for match, score, i in matches if score > score_cutoff]
@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+
+
+class _Totals:
+    """One build of the aggregates: per-salesman running totals plus the last row ids read."""
+
+    def __init__(self):
+        self.last_item_id = 0
+        self.last_order_id = 0
+        # Carts above last_order_id that were already counted.
+        self.counted_orders = set()
+        # salesman -> day -> (product, area, status) -> [qty, revenue]
+        self.daily_products = {}
+        # salesman -> (product, area, status) -> [qty, revenue]
+        self.products = {}
+        # salesman -> day -> (area, status) -> [orders, revenue]
+        self.daily_orders = {}
+        # salesman -> (area, status) -> [orders, revenue]
+        self.orders = {}
+
+    def add_item(self, item_id, salesman, product_name, area, status, day, qty, total):
+        self.last_item_id = max(self.last_item_id, item_id)
+        key = (product_name, area, status)
+        for entries in (self.daily_products.setdefault(salesman, {}).setdefault(day, {}),
+                        self.products.setdefault(salesman, {})):
+            entry = entries.setdefault(key, [0, 0.0])
+            entry[0] += int(qty or 0)
+            entry[1] += float(total or 0)
+
+    def add_orders(self, rows, skip_empty=False):
+        """Count the carts in `rows` (in id order) that have items.
+
+        The watermark stops at the first cart without items, since its items may not
+        have been inserted yet; the carts after it are read again on the next refresh
+        and skipped if they were counted. With `skip_empty` such carts are passed over.
+        """
+        advancing = True
+        for order_id, salesman, area, status, day, final_total, has_items in rows:
+            if has_items and order_id not in self.counted_orders:
+                self.counted_orders.add(order_id)
+                for entries in (self.daily_orders.setdefault(salesman, {}).setdefault(day, {}),
+                                self.orders.setdefault(salesman, {})):
+                    entry = entries.setdefault((area, status), [0, 0.0])
+                    entry[0] += 1
+                    entry[1] += float(final_total or 0)
+            advancing = advancing and bool(has_items or skip_empty)
+            if advancing:
+                self.last_order_id = order_id
+                self.counted_orders.discard(order_id)
+
+
+def _matches(area, status, area_filter, status_filter):
+    if status_filter and (status or "").lower() != status_filter.lower():
+        return False
+    if area_filter and area_filter.lower() not in (area or "").lower():
+        return False
+    return True
+
+
+class SalesAggregateStore:
+    """In-process sales totals by salesman, product, area, status and day.
+
+    `load_items(last_id)` returns cart_item facts as (id, salesman, product_name, area,
+    status, day, qty, total) and `load_orders(last_id)` returns cart facts as (id,
+    salesman, area, status, day, final_total, has_items), each only for rows above
+    `last_id`. Every query first reads those new rows, which is a primary-key range
+    lookup. Edits to existing carts, such as a status change, are not visible to that
+    lookup, so once the store is older than `rebuild_interval` seconds a fresh one is
+    built on a background thread, inside `context()` when given, and swapped in. Queries
+    hold the lock while they read, so they never see a refresh half applied.
+    """
+
+    def __init__(self, load_items, load_orders, rebuild_interval=300, context=None):
+        self._load_items = load_items
+        self._load_orders = load_orders
+        self._rebuild_interval = rebuild_interval
+        self._context = context
+        self._lock = threading.RLock()
+        self._totals = _Totals()
+        self._built_at = None
+        self._rebuilding = False
+
+    def _read_new_rows(self, totals, rebuild=False):
+        for row in self._load_items(totals.last_item_id):
+            totals.add_item(*row)
+        totals.add_orders(self._load_orders(totals.last_order_id), skip_empty=rebuild)
+
+    def _rebuild(self):
+        try:
+            started = time.monotonic()
+            totals = _Totals()
+            if self._context is not None:
+                with self._context():
+                    self._read_new_rows(totals, rebuild=True)
+            else:
+                self._read_new_rows(totals, rebuild=True)
+            with self._lock:
+                self._totals = totals
+                self._built_at = started
+        except Exception:
+            logging.exception("Rebuilding the sales aggregates failed")
+        finally:
+            self._rebuilding = False
+
+    def refresh(self):
+        with self._lock:
+            if self._built_at is None:
+                # Nothing to answer from yet, so the first build runs in the caller.
+                started = time.monotonic()
+                self._read_new_rows(self._totals, rebuild=True)
+                self._built_at = started
+                return
+            self._read_new_rows(self._totals)
+            if not self._rebuilding and time.monotonic() - self._built_at >= self._rebuild_interval:
+                self._rebuilding = True
+                threading.Thread(target=self._rebuild, name='sales-aggregates', daemon=True).start()
+
+    def top_products(self, salesman, limit=5, status=None, area=None, day=None, by='qty'):
+        """Products ranked by quantity sold (or by revenue with by='revenue')."""
+        with self._lock:
+            self.refresh()
+            return self._top_products(salesman, limit, status, area, day, by)
+
+    def _top_products(self, salesman, limit, status, area, day, by):
+        totals = self._totals
+        # A dated question reads only that day's entries.
+        if day:
+            stats = totals.daily_products.get(salesman, {}).get(day, {}).items()
+        else:
+            stats = totals.products.get(salesman, {}).items()
+
+        products = {}
+        for (product_name, key_area, key_status), (qty, revenue) in stats:
+            if _matches(key_area, key_status, area, status):
+                entry = products.setdefault(product_name, [0, 0.0])
+                entry[0] += qty
+                entry[1] += revenue
+
+        rank = 1 if by == 'revenue' else 0
+        ranked = sorted(products.items(), key=lambda item: -item[1][rank])[:limit]
+        return [{'product_name': name, 'qty': qty, 'revenue': round(revenue, 2)} for name, (qty, revenue) in ranked]
+
+    def _order_stats(self, salesman, status, area, day):
+        totals = self._totals
+        if day:
+            stats = totals.daily_orders.get(salesman, {}).get(day, {}).items()
+        else:
+            stats = totals.orders.get(salesman, {}).items()
+        return (((key_area, key_status), value) for (key_area, key_status), value in stats
+                if _matches(key_area, key_status, area, status))
+
+    def revenue_by_area(self, salesman, status=None, area=None, day=None):
+        with self._lock:
+            self.refresh()
+            return self._revenue_by_area(salesman, status, area, day)
+
+    def _revenue_by_area(self, salesman, status, area, day):
+        areas = {}
+        for (key_area, key_status), (orders, revenue) in self._order_stats(salesman, status, area, day):
+            entry = areas.setdefault(key_area, [0, 0.0])
+            entry[0] += orders
+            entry[1] += revenue
+        ranked = sorted(areas.items(), key=lambda item: -item[1][1])
+        return [{'buyer_area_name': name, 'orders': orders, 'revenue': round(revenue, 2)}
+                for name, (orders, revenue) in ranked]
+
+    def order_count(self, salesman, status=None, area=None, day=None):
+        with self._lock:
+            self.refresh()
+            return self._order_count(salesman, status, area, day)
+
+    def _order_count(self, salesman, status, area, day):
+        orders, revenue = 0, 0.0
+        for key, (key_orders, key_revenue) in self._order_stats(salesman, status, area, day):
+            orders += key_orders
+            revenue += key_revenue
+        return {'orders': orders, 'revenue': round(revenue, 2)}
@@ -0,0 +1,58 @@
+import threading
+
+from rapidfuzz import fuzz, process
+
+
+class CartItemNameCache:
+    """Distinct lower-cased cart_item product names, kept per process.
+
+    `loader(last_id)` returns (id, lower(product_name)) rows with id > last_id in id
+    order, so after the first call each refresh only reads the rows added since.
+    Names of edited or deleted cart items are not dropped; a stale name can only
+    widen the fuzzy candidate list, it never changes which orders match.
+
+    Matches are memoized per lower-cased term (at most `max_matches` of them) and the
+    memo is cleared whenever a refresh brings in new names.
+    """
+
+    def __init__(self, loader, max_matches=4096):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._seen = set()
+        self._names = []
+        self._max_matches = max_matches
+        self._matches = {}
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._names)
+
+    def refresh(self):
+        with self._lock:
+            for row_id, name in self._loader(self._last_id):
+                self._last_id = max(self._last_id, row_id)
+                if name is not None and name not in self._seen:
+                    self._seen.add(name)
+                    self._names.append(name)
+                    self._matches.clear()
+                    self._generation += 1
+
+    def match(self, product_name, limit=5, score_cutoff=90):
+        self.refresh()
+        key = (product_name.lower(), limit, score_cutoff)
+        found = self._matches.get(key)
+        if found is not None:
+            return list(found)
+
+        generation = self._generation
+        matches = process.extract(key[0], self._names, scorer=fuzz.partial_ratio,
+                                  processor=None, score_cutoff=score_cutoff, limit=limit)
+        found = [match for match, score, i in matches if score > score_cutoff]
+        with self._lock:
+            # Only kept if no names arrived while matching, and dropped wholesale when full.
+            if generation == self._generation:
+                if len(self._matches) >= self._max_matches:
+                    self._matches.clear()
+                self._matches[key] = found
+        return list(found)
@@ -0,0 +1,106 @@
+import re
+
+from sqlalchemy import text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+# Generated columns the filters rely on, as (table, column, type, expression). MySQL
+# rewrites a WHERE expression that matches a generated column's definition into a
+# lookup on that column, so LOWER(cart.status) = :status can use its index as written.
+GENERATED_COLUMNS = (
+    ("cart", "status_lower", "VARCHAR(255)", "LOWER(`status`)"),
+    ("cart_item", "product_name_lower", "VARCHAR(255)", "LOWER(`product_name`)"),
+)
+
+# (table, index name, columns) for the joins, filters and sorts of the search and
+# sales-order queries. Every cart lookup starts from the logged-in salesman's buyer_id.
+INDEXES = (
+    ("cart", "idx_cart_buyer_created", ("buyer_id", "created", "id")),
+    ("cart", "idx_cart_buyer_status_created", ("buyer_id", "status_lower", "created", "id")),
+    ("cart_item", "idx_cart_item_cart", ("cart_id", "id")),
+    ("cart_item", "idx_cart_item_product_name", ("product_name_lower", "cart_id")),
+    ("salesman", "idx_salesman_username", ("username",)),
+    ("product", "idx_product_sub_category", ("sub_category",)),
+    ("product", "idx_product_brand", ("brand",)),
+    ("sub_category", "idx_sub_category_category", ("category",)),
+)
+
+_SQLITE_FULL_SCAN_RE = re.compile(r'^SCAN (\w+)$')
+
+
+class Explain(Executable, ClauseElement):
+    """`statement` prefixed with EXPLAIN, compiled with the same bind parameter handling."""
+
+    inherit_cache = False
+
+    def __init__(self, statement, prefix):
+        self.statement = statement
+        self.prefix = prefix
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    return element.prefix + compiler.process(element.statement, **kw)
+
+
+def _mysql_has_column(connection, table, column):
+    return connection.execute(text("""
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND COLUMN_NAME = :column
+    """), {'table': table, 'column': column}).first() is not None
+
+
+def _mysql_has_index(connection, table, index):
+    return connection.execute(text("""
+        SELECT 1 FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND INDEX_NAME = :index
+    """), {'table': table, 'index': index}).first() is not None
+
+
+def _bootstrap_mysql(connection):
+    applied = []
+    for table, column, column_type, expression in GENERATED_COLUMNS:
+        if not _mysql_has_column(connection, table, column):
+            statement = f"ALTER TABLE `{table}` ADD COLUMN `{column}` {column_type} AS ({expression}) VIRTUAL"
+            connection.execute(text(statement))
+            applied.append(statement)
+    for table, index, columns in INDEXES:
+        if not _mysql_has_index(connection, table, index):
+            statement = f"CREATE INDEX `{index}` ON `{table}` ({', '.join(f'`{column}`' for column in columns)})"
+            connection.execute(text(statement))
+            applied.append(statement)
+    return applied
+
+
+def _bootstrap_sqlite(connection):
+    # SQLite matches expression indexes against the query text directly, so the
+    # generated columns are indexed by their expressions instead of being added.
+    expressions = {(table, column): expression.replace('`', '"')
+                   for table, column, column_type, expression in GENERATED_COLUMNS}
+    applied = []
+    for table, index, columns in INDEXES:
+        exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :index"),
+                                    {'index': index}).first()
+        if exists is None:
+            parts = ", ".join(expressions.get((table, column), f'"{column}"') for column in columns)
+            statement = f'CREATE INDEX "{index}" ON "{table}" ({parts})'
+            connection.execute(text(statement))
+            applied.append(statement)
+    return applied
+
+
+def bootstrap_indexes(connection):
+    """Create the missing generated columns and indexes; returns the statements run."""
+    if connection.dialect.name == 'sqlite':
+        return _bootstrap_sqlite(connection)
+    return _bootstrap_mysql(connection)
+
+
+def explain(connection, statement, params):
+    """Tables the plan for `statement` reads with a full table scan."""
+    sqlite = connection.dialect.name == 'sqlite'
+    prefix = "EXPLAIN QUERY PLAN " if sqlite else "EXPLAIN "
+    rows = connection.execute(Explain(statement, prefix), params).fetchall()
+    if sqlite:
+        return [match.group(1) for match in (_SQLITE_FULL_SCAN_RE.match(row.detail) for row in rows) if match]
+    return [row._mapping['table'] for row in rows if row._mapping['type'] == 'ALL']
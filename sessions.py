@@ -0,0 +1,109 @@
+import json
+import re
+from collections import namedtuple
+
+from cache import TTLCache
+
+_PAGE_RE = re.compile(
+    r"^(?:(?:show|give|get|load|see|fetch)(?: me)? )?(?:the )?(?:next|more)(?: (\d+))?(?: more)?"
+    r"(?: (?:ones|orders|sales orders|results|page|please))*[.!? ]*$"
+)
+_STATUS_RE = re.compile(
+    r"^(?:(?:show|give|get)(?: me)? )?(?:only|just)(?: the)? (pending|void|confirm(?:ed)?)"
+    r"(?: (?:ones|orders|sales orders))?(?: only)?[.!? ]*$"
+)
+_AREA_RE = re.compile(r"^(?:only|just)(?: the)?(?: ones| orders)? (?:in|from) ([a-z][a-z ]*?)(?: area)?[.!? ]*$")
+_SORT_RE = re.compile(r"^(?:(?:show|sort)(?: by)? )?(?:the )?(oldest|earliest|newest|latest)(?: ones| orders)? first[.!? ]*$")
+
+# What a follow-up resolves to: the entities to query with, the cursor to continue from
+# (None restarts from the first page) and whether the previous query has no pages left.
+FollowUp = namedtuple('FollowUp', ['entities', 'cursor', 'exhausted'])
+
+
+def parse_follow_up(message):
+    """Read a follow-up to the previous sales-order query, or return None if the message is not one.
+
+    Returns {"page": True, "limit": n or None} for "next 10" / "more", or {"changes": {...}}
+    with the entities to override for refinements such as "only the pending ones".
+    """
+    text = " ".join(str(message or "").lower().split())
+    if not text:
+        return None
+
+    match = _PAGE_RE.match(text)
+    if match:
+        return {"page": True, "limit": int(match.group(1)) if match.group(1) else None}
+    match = _STATUS_RE.match(text)
+    if match:
+        status = "confirm" if match.group(1).startswith("confirm") else match.group(1)
+        return {"changes": {"status": status}}
+    match = _AREA_RE.match(text)
+    if match:
+        return {"changes": {"buyer_area_name": match.group(1)}}
+    match = _SORT_RE.match(text)
+    if match:
+        return {"changes": {"sort_order": "asc" if match.group(1) in ("oldest", "earliest") else "desc"}}
+    return None
+
+
+class RedisSessionBackend:
+    """Sessions in a Redis-compatible server, shared by every worker; values are stored as JSON."""
+
+    def __init__(self, url, ttl=1800, prefix="salesnav:session:"):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self._prefix = prefix
+
+    def get(self, key, default=None):
+        value = self._client.get(self._prefix + key)
+        return json.loads(value) if value is not None else default
+
+    def set(self, key, value):
+        self._client.set(self._prefix + key, json.dumps(value), ex=int(self.ttl))
+
+    def delete(self, key):
+        self._client.delete(self._prefix + key)
+
+
+class SessionStore:
+    """The last sales-order query of each user: its entities and the cursor of its next page.
+
+    `backend` is anything with the TTLCache get/set/delete interface; by default sessions
+    live in this process only and are evicted by LRU order and after `ttl` seconds.
+    """
+
+    def __init__(self, backend=None, maxsize=10000, ttl=1800):
+        self._backend = backend if backend is not None else TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, username):
+        if not username:
+            return None
+        return self._backend.get(str(username))
+
+    def save(self, username, entities, next_cursor=None):
+        if username:
+            self._backend.set(str(username), {"entities": dict(entities), "next_cursor": next_cursor})
+
+    def clear(self, username):
+        if username:
+            self._backend.delete(str(username))
+
+    def follow_up(self, username, message):
+        """The FollowUp to run for `message` against the user's last query, or None for a new query."""
+        follow_up = parse_follow_up(message)
+        if follow_up is None:
+            return None
+        session = self.get(username)
+        if session is None:
+            return None
+
+        entities = dict(session["entities"])
+        if follow_up.get("page"):
+            if follow_up["limit"]:
+                entities["limit"] = follow_up["limit"]
+            return FollowUp(entities, session["next_cursor"], session["next_cursor"] is None)
+
+        entities.update(follow_up["changes"])
+        return FollowUp(entities, None, False)
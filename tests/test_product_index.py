@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from product_index import ProductIndex
+
+ROWS = [
+    (1, "Claw Hammer 16oz", None, None, None, "Hammers", "Hand Tools", "Stanley"),
+    (2, "Sledge Hammer Red", None, None, None, "Hammers", "Hand Tools", "Bosch"),
+    (3, "Cordless Drill", None, None, None, "Drills", "Power Tools", "Bosch"),
+    (4, "Drill Bit Set Red", None, None, None, "Accessories", "Power Tools", "Makita"),
+    (5, "Hammer Drill", None, None, None, "Drills", "Power Tools", "Makita"),
+]
+
+
+def make_index(rows=ROWS, **kwargs):
+    rows = list(rows)
+    return ProductIndex(lambda: rows, lambda: (len(rows), max(row[0] for row in rows)), **kwargs), rows
+
+
+def names(products):
+    return [product.product_name for product in products]
+
+
+def test_requires_every_term():
+    index, _ = make_index()
+    assert names(index.search("hammer drill")) == ["Hammer Drill"]
+
+
+def test_ranks_name_hits_above_brand_hits():
+    index, _ = make_index([
+        (1, "Angle Grinder", None, None, None, None, None, "Bosch"),
+        (2, "Bosch Tool Box", None, None, None, None, None, "Stanley"),
+    ])
+    assert names(index.search("bosch")) == ["Bosch Tool Box", "Angle Grinder"]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("ham", {"Claw Hammer 16oz", "Sledge Hammer Red", "Hammer Drill"}),
+    ("cordle", {"Cordless Drill"}),
+    ("16", {"Claw Hammer 16oz"}),
+])
+def test_matches_substrings_of_tokens(query, expected):
+    index, _ = make_index()
+    assert set(names(index.search(query))) == expected
+
+
+def test_exact_token_ranks_above_substring_hit():
+    index, _ = make_index([
+        (1, "Drills Organiser", None, None, None, None, None, None),
+        (2, "Drill Press", None, None, None, None, None, None),
+    ])
+    assert names(index.search("drill")) == ["Drill Press", "Drills Organiser"]
+
+
+def test_filters_by_colour():
+    index, _ = make_index()
+    assert set(names(index.search("", color="Red"))) == {"Sledge Hammer Red", "Drill Bit Set Red"}
+    assert names(index.search("hammer", color="red")) == ["Sledge Hammer Red"]
+
+
+def test_rebuilds_in_the_background_when_the_signature_changes():
+    index, rows = make_index(check_interval=0)
+    index.refresh()
+    assert len(index) == 5
+    rows.append((6, "Masonry Drill Bit", None, None, None, None, None, None))
+    index.refresh()
+    deadline = time.monotonic() + 5
+    while len(index) == 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert names(index.search("masonry")) == ["Masonry Drill Bit"]